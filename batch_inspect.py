@@ -0,0 +1,80 @@
+"""Offline requalification: run a saved cycle config against a folder of images.
+
+Usage:
+    python batch_inspect.py config.json images/ --output results.csv --workers 4
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from inspection_engine import load_cycle_config, run_cycle
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Set once per worker process by init_worker so tasks only carry an image path
+_config = None
+
+def init_worker(config_path):
+    global _config
+    cv2.setNumThreads(1)  # one process per core already, avoid oversubscription
+    _config = load_cycle_config(config_path)
+
+def inspect_file(path):
+    settings, rois = _config
+    frame = cv2.imread(path)
+    if frame is None:
+        return path, "ERROR", [[path, "", "", "ERROR", "", "Unreadable image"]]
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    try:
+        overall_result, results = run_cycle(frame, rois, settings)
+    except Exception as e:
+        return path, "ERROR", [[path, "", "", "ERROR", "", str(e)]]
+    rows = [[path, r["roi_id"], r["inspection_type"], r["result"], f"{r['value']:.4f}", r["details"]] for r in results]
+    return path, overall_result, rows
+
+def list_images(directory):
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        paths.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a VisionMaster cycle config against a directory of images.")
+    parser.add_argument("config", help="cycle config JSON written by Save Config")
+    parser.add_argument("images", help="directory of images (searched recursively)")
+    parser.add_argument("--output", default="batch_results.csv", help="CSV file for per-ROI results")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--chunksize", type=int, default=16, help="images handed to a worker at a time")
+    args = parser.parse_args(argv)
+
+    paths = list_images(args.images)
+    if not paths:
+        print(f"No images found in {args.images}")
+        return 1
+    counts = {"OK": 0, "NG": 0, "ERROR": 0}
+    pending_rows = []
+    start = time.perf_counter()
+    with open(args.output, "w", newline="") as f, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.config,)) as pool:
+        writer = csv.writer(f)
+        writer.writerow(["Image", "ROI ID", "Inspection Type", "Result", "Value", "Details"])
+        for done, (path, overall_result, rows) in enumerate(pool.map(inspect_file, paths, chunksize=args.chunksize), 1):
+            counts[overall_result] += 1
+            pending_rows.extend(rows)
+            if len(pending_rows) >= 1000:
+                writer.writerows(pending_rows)
+                pending_rows.clear()
+            if done % 100 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{done}/{len(paths)} images, {done / elapsed:.1f} images/s", flush=True)
+        writer.writerows(pending_rows)
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(paths)} images in {elapsed:.1f} s ({len(paths) / elapsed:.1f} images/s): "
+          f"{counts['OK']} OK, {counts['NG']} NG, {counts['ERROR']} errors. Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
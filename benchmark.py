@@ -0,0 +1,215 @@
+"""Headless timing of every inspection routine on synthetic parts.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --output bench_new.json --compare bench.json --tolerance 0.15
+
+Each case is run on a fresh InspectionContext so shared preprocessing is timed
+too. With --compare, cases whose median got slower than the baseline by more than
+the tolerance are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from inspection_engine import (DEFAULT_JUDGMENT_CRITERIA, INSPECTIONS, MAX_SCALE_LEVEL, SCALE_PARAMS, InspectionContext, RoiMask,
+                               TemplateModel, freeze_settings, run_cycle)
+from process_pool import ProcessInspectionPool
+
+# HMI defaults, with blob limits opened up so every synthetic blob is measured
+BENCH_PARAMS = {
+    "density_threshold_min": 90.0, "density_threshold_max": 110.0,
+    "contrast_threshold_min": 10.0, "contrast_threshold_max": 30.0,
+    "edge_threshold_min": 50.0, "edge_threshold_max": 150.0,
+    "edge_canny_low": 50.0, "edge_canny_high": 150.0, "edge_median_blur": 5,
+    "blob_threshold_manual": True, "blob_threshold_value": 128.0,
+    "blob_area_min": 10.0, "blob_area_max": 5000.0,
+    "blob_width_min": 3.0, "blob_width_max": 100.0,
+    "blob_height_min": 3.0, "blob_height_max": 100.0,
+    "blob_circularity_min": 0.5, "blob_circularity_max": 1.0,
+    "blob_aspect_ratio_min": 0.5, "blob_aspect_ratio_max": 2.0,
+    "blob_solidity_min": 0.8, "blob_solidity_max": 1.0,
+    "blob_bounding_shape": "None", "blob_color_mode": "Grayscale",
+    "blob_rgb_r_min": 0.0, "blob_rgb_r_max": 255.0,
+    "blob_rgb_g_min": 0.0, "blob_rgb_g_max": 255.0,
+    "blob_rgb_b_min": 0.0, "blob_rgb_b_max": 255.0,
+    "blob_hsv_h_min": 0.0, "blob_hsv_h_max": 180.0,
+    "blob_hsv_s_min": 0.0, "blob_hsv_s_max": 255.0,
+    "blob_hsv_v_min": 0.0, "blob_hsv_v_max": 255.0,
+    "blob_bilateral_sigma": 10.0, "boundary_exclusion": True,
+    "measurement_tolerance_min": 0.1, "measurement_tolerance_max": 0.3,
+    "focus_threshold_min": 80.0, "focus_threshold_max": 120.0,
+    "color_ratio_min": 0.0, "color_ratio_max": 100.0,
+    "color_hue_min": 100.0, "color_hue_max": 130.0,
+    "color_saturation_min": 50.0, "color_saturation_max": 255.0,
+    "color_brightness_min": 50.0, "color_brightness_max": 255.0,
+    "template_threshold_min": 0.7, "template_threshold_max": 1.0,
+    "contour_area_threshold_min": 400.0, "contour_area_threshold_max": 600.0,
+    "contour_perimeter_min": 50.0, "contour_perimeter_max": 500.0,
+    "contour_circularity_min": 0.5, "contour_circularity_max": 1.0,
+    "contour_gaussian_blur": 5, "contour_morph_kernel": 3, "contour_hierarchy_mode": "External"
+}
+
+BENCH_CRITERIA = dict(DEFAULT_JUDGMENT_CRITERIA, criteria_type="Blob count limit", blob_count_max=10000.0, blob_area_max=5000.0)
+
+ROI_SIZES = (64, 128, 256, 512)
+BLOB_COUNTS = (5, 50, 500)
+BLUR_LEVELS = (0, 3, 9)
+
+def synthetic_part(size, blobs=20, blur=0, seed=0):
+    """RGB image of a square part: bright blobs, a dark edge-rich bar and a blue patch on grey."""
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size, 3), 100, dtype=np.uint8)
+    noise = rng.normal(0, 8, (size, size, 1))
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    cv2.rectangle(img, (size // 8, size // 8), (size // 3, size - size // 8), (30, 30, 30), -1)
+    cv2.rectangle(img, (size // 2, size // 2), (size - size // 8, size - size // 8), (40, 60, 200), -1)
+    radius = max(2, int(size / (4 * np.sqrt(blobs + 1))))
+    for cx, cy in rng.integers(radius + 3, size - radius - 3, (blobs, 2)):
+        cv2.circle(img, (int(cx), int(cy)), radius, (230, 230, 230), -1)
+    if blur:
+        img = cv2.GaussianBlur(img, (2 * blur + 1, 2 * blur + 1), 0)
+    return img
+
+def full_roi(size, roi_id=1):
+    return (0, 0, size, size, roi_id, 0.0, "rectangle", RoiMask.blank(size, size))
+
+def time_call(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_ms": samples[0],
+        "runs": len(samples)
+    }
+
+BENCH_SETTINGS = freeze_settings(BENCH_PARAMS, BENCH_CRITERIA, {}, {feature: True for feature in INSPECTIONS})
+TEMPLATE_SIZES = (24, 64)
+
+def bench_inspection(feature, frame, roi, repeat, settings=BENCH_SETTINGS):
+    inspection = INSPECTIONS[feature]
+    return time_call(lambda: inspection(InspectionContext(frame), roi, settings), repeat)
+
+def cases(quick=False):
+    """Yield (name, thunk) for every benchmark case; thunk(repeat) returns the timing dict."""
+    sizes = ROI_SIZES[:2] if quick else ROI_SIZES
+    for size in sizes:
+        frame = synthetic_part(size)
+        roi = full_roi(size)
+        for feature in ("Density", "Contrast", "Edge", "Color Detection", "Measurement", "Contour Analysis"):
+            yield f"{feature}/{size}", lambda r, f=feature, fr=frame, ro=roi: bench_inspection(f, fr, ro, r)
+        for blobs in BLOB_COUNTS:
+            blob_frame = synthetic_part(size, blobs=blobs, seed=blobs)
+            yield f"Blob Detection/{size}/{blobs}", lambda r, fr=blob_frame, ro=roi: bench_inspection("Blob Detection", fr, ro, r)
+        for blur in BLUR_LEVELS:
+            blur_frame = synthetic_part(size, blur=blur)
+            yield f"Focus Check/{size}/blur{blur}", lambda r, fr=blur_frame, ro=roi: bench_inspection("Focus Check", fr, ro, r)
+        for template_size in TEMPLATE_SIZES:
+            if template_size < size:
+                offset = (size - template_size) // 3
+                template = TemplateModel(frame[offset:offset + template_size, offset:offset + template_size].copy())
+                settings = BENCH_SETTINGS._replace(template=template)
+                yield f"Template Matching/{size}/{template_size}", \
+                    lambda r, fr=frame, ro=roi, s=settings: bench_inspection("Template Matching", fr, ro, r, s)
+    # Reduced processing scales on the largest ROI; the pyramid is rebuilt per run, as it is per frame
+    size = sizes[-1]
+    frame = synthetic_part(size, blobs=50, seed=50)
+    roi = full_roi(size)
+    for feature, key in SCALE_PARAMS.items():
+        for level in range(1, MAX_SCALE_LEVEL + 1):
+            settings = freeze_settings(dict(BENCH_PARAMS, **{key: level}), BENCH_CRITERIA, {}, {})
+            yield f"{feature}/{size}/level{level}", lambda r, f=feature, s=settings: bench_inspection(f, frame, roi, r, s)
+    # Whole cycle, as run_cycle_logic does it: 640x480 frame, 4 ROIs, every feature enabled
+    frame = cv2.resize(synthetic_part(480, blobs=100), (640, 480))
+    rois = [(x, y, 200, 200, i + 1, 0.0, "rectangle", RoiMask.blank(200, 200))
+            for i, (x, y) in enumerate(((20, 20), (240, 20), (20, 260), (420, 260)))]
+    settings = BENCH_SETTINGS._replace(template=TemplateModel(frame[60:124, 60:124].copy()))
+    yield "Cycle/sequential", lambda r: time_call(lambda: run_cycle(frame, rois, settings), r)
+    def threaded(r):
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            return time_call(lambda: run_cycle(frame, rois, settings, executor), r)
+    yield "Cycle/threaded", threaded
+    def processes(r):
+        pool = ProcessInspectionPool(os.cpu_count())
+        try:
+            return time_call(lambda: run_cycle(frame, rois, settings, pool), r)
+        finally:
+            pool.shutdown()
+    yield "Cycle/processes", processes
+    # Tray of 48 small unmasked pockets with density and contrast only
+    pockets = [(20 + 75 * (i % 8), 20 + 75 * (i // 8), 60, 60, i + 1, 0.0, "rectangle", RoiMask.blank(60, 60)) for i in range(48)]
+    tray = freeze_settings(BENCH_PARAMS, BENCH_CRITERIA, {}, {"Density": True, "Contrast": True})
+    yield "Cycle/tray48", lambda r: time_call(lambda: run_cycle(frame, pockets, tray), r)
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def compare(results, baseline, tolerance):
+    """Return [(name, baseline_ms, current_ms)] for cases whose median regressed beyond tolerance."""
+    regressions = []
+    for name, timing in results.items():
+        base = baseline.get(name)
+        if base and timing["median_ms"] > base["median_ms"] * (1 + tolerance):
+            regressions.append((name, base["median_ms"], timing["median_ms"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VisionMaster inspection routines on synthetic images.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the timings")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="only the two smallest ROI sizes")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this text")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown vs the baseline median (0.10 = 10%%)")
+    parser.add_argument("--threads", type=int, help="cv2.setNumThreads value (default: OpenCV's choice)")
+    args = parser.parse_args(argv)
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    results = {}
+    for name, run in cases(args.quick):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run(args.repeat)
+        timing = results[name]
+        print(f"{name:32s} median {timing['median_ms']:8.3f} ms  p95 {timing['p95_ms']:8.3f} ms", flush=True)
+    with open(args.output, "w") as f:
+        json.dump({"machine": machine_info(), "repeat": args.repeat, "results": results}, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if baseline.get("machine", {}).get("machine") != platform.machine():
+            print(f"Warning: baseline was recorded on {baseline.get('machine', {}).get('machine')}, not {platform.machine()}")
+        for name, base_ms, current_ms in regressions:
+            print(f"REGRESSION {name}: {base_ms:.3f} ms -> {current_ms:.3f} ms (+{(current_ms / base_ms - 1) * 100:.0f}%)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance * 100:.0f}% against {args.compare}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
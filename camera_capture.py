@@ -0,0 +1,93 @@
+"""Background camera capture into a small latest-frame ring buffer."""
+import threading
+import time
+
+class FrameGrabber:
+    """Drains a cv2.VideoCapture on its own thread so readers always get the newest frame.
+
+    Frames are read straight into preallocated slots. The slot being written is never
+    the published one, so latest() only holds the lock long enough to copy a frame.
+    """
+
+    def __init__(self, cap, buffer_size=3, metrics=None):
+        if buffer_size < 2:
+            raise ValueError("buffer_size must be at least 2")
+        self.cap = cap
+        self.metrics = metrics  # optional metrics.Metrics, gets the duration of every read as "capture"
+        self.buffer_size = buffer_size
+        self._slots = [None] * buffer_size
+        self._seqs = [0] * buffer_size
+        self._stamps = [0.0] * buffer_size
+        self._latest_slot = -1
+        self._last_consumed_seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        # captured: frames read; displayed/inspected: frames handed to each consumer;
+        # dropped: frames overwritten before any consumer took them; failed: unsuccessful reads
+        self.counters = {"captured": 0, "displayed": 0, "inspected": 0, "dropped": 0, "failed": 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="FrameGrabber", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        slot = 0
+        seq = 0
+        while self._running:
+            start = time.perf_counter()
+            ret, frame = self.cap.read(self._slots[slot]) if self._slots[slot] is not None else self.cap.read()
+            stamp = time.monotonic()
+            if self.metrics:
+                self.metrics.observe("capture", time.perf_counter() - start)
+            if not ret or frame is None:
+                self.counters["failed"] += 1
+                time.sleep(0.01)
+                continue
+            seq += 1
+            with self._cond:
+                self._slots[slot] = frame  # read() reallocates if the camera resolution changed
+                self._seqs[slot] = seq
+                self._stamps[slot] = stamp
+                self._latest_slot = slot
+                self.counters["captured"] += 1
+                self._cond.notify_all()
+            slot = (slot + 1) % self.buffer_size
+
+    def latest(self, consumer=None, timeout=0.0, copy=True, newer_than=None):
+        """Return (seq, timestamp, frame) for the newest BGR frame, or None if there is none yet.
+
+        consumer is "displayed" or "inspected" and only feeds the counters. A positive
+        timeout waits that long for the first frame, or with newer_than (a monotonic
+        timestamp such as a trigger edge) for a frame captured after that instant;
+        otherwise the call never blocks.
+        """
+        def ready():
+            return self._latest_slot >= 0 and (newer_than is None or self._stamps[self._latest_slot] > newer_than)
+        with self._cond:
+            if not ready() and timeout > 0:
+                self._cond.wait_for(ready, timeout)
+            if not ready():
+                return None
+            slot = self._latest_slot
+            seq = self._seqs[slot]
+            frame = self._slots[slot].copy() if copy else self._slots[slot]
+            if seq > self._last_consumed_seq:
+                self.counters["dropped"] += seq - self._last_consumed_seq - 1
+                self._last_consumed_seq = seq
+            if consumer:
+                self.counters[consumer] += 1
+            return seq, self._stamps[slot], frame
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counters)
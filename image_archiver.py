@@ -0,0 +1,171 @@
+"""Background archive of inspected frames (NG, and optionally every Nth OK) under a disk quota."""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import cv2
+import numpy as np
+from inspection_engine import roi_point
+
+ARCHIVE_EXTENSIONS = (".png", ".jpg")
+
+class ImageArchiver:
+    """Saves frames from a writer thread so encoding and disk I/O never touch the inspection path.
+
+    submit() only queues a reference to the raw RGB frame (which must not be modified
+    afterwards) together with its ROIs and results; the writer thread draws the ROI
+    outlines, coloured by each ROI's verdict, encodes the image as PNG (png_level 0-9)
+    or JPEG (jpeg_quality 0-100) and writes it to directory as
+    <timestamp>_cycle<id>_<verdict>[_roi<ids of NG ROIs>].<ext>. Once the archive is over
+    quota_bytes the oldest archived images are deleted. A full queue drops the frame.
+    """
+
+    def __init__(self, directory, image_format="png", png_level=3, jpeg_quality=90, ok_every=0,
+                 quota_bytes=500 * 1024 * 1024, max_queue=8):
+        self.directory = directory
+        self.configure(image_format=image_format, png_level=png_level, jpeg_quality=jpeg_quality,
+                       ok_every=ok_every, quota_bytes=quota_bytes)
+        self.counters = {"queued": 0, "written": 0, "dropped": 0, "evicted": 0, "errors": 0}
+        self.last_error = None
+        self._lock = threading.Lock()  # submit() runs on several threads, the writer on its own; stats() reads both
+        self._ok_seen = 0
+        self._files = deque()  # (path, size) of archived images, oldest first
+        self._total_bytes = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = object()
+        self._thread = threading.Thread(target=self._run, name="ImageArchiver", daemon=True)
+        self._thread.start()
+
+    def configure(self, image_format=None, png_level=None, jpeg_quality=None, ok_every=None, quota_bytes=None):
+        """Change options; takes effect from the next queued frame. Call from one thread only."""
+        if image_format is not None:
+            self.image_format = image_format.lower()
+        if png_level is not None:
+            self.png_level = int(png_level)
+        if jpeg_quality is not None:
+            self.jpeg_quality = int(jpeg_quality)
+        if ok_every is not None:
+            self.ok_every = int(ok_every)  # 0: never archive OK frames
+        if quota_bytes is not None:
+            self.quota_bytes = int(quota_bytes)
+
+    def submit(self, frame, cycle_id, verdict, rois, results):
+        """Queue frame if the archive policy wants it; never blocks. Returns True if queued."""
+        if verdict == "OK":
+            with self._lock:
+                self._ok_seen += 1
+                if not self.ok_every or self._ok_seen % self.ok_every:
+                    return False
+        ng_rois = sorted({r["roi_id"] for r in results if r["result"] != "OK"}, key=str)
+        name = f"{datetime.now():%Y%m%d_%H%M%S_%f}_cycle{cycle_id}_{verdict}"
+        if ng_rois:
+            name += "_roi" + "-".join(str(roi_id) for roi_id in ng_rois)
+        return self._put((os.path.join(self.directory, name), frame, rois, ng_rois, self._options(), True))
+
+    def save(self, frame, path_stem):
+        """Queue a one-off save of frame (e.g. the Save Image button); not counted against the quota."""
+        return self._put((path_stem, frame, (), (), self._options(), False))
+
+    def _options(self):
+        return (self.image_format, self.png_level, self.jpeg_quality)
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            self._count("queued")
+            return True
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+    def _count(self, name, error=None):
+        with self._lock:
+            self.counters[name] += 1
+            if error is not None:
+                self.last_error = error
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, queue_depth=self.queue_depth(), archive_bytes=self._total_bytes)
+
+    def close(self, timeout=5.0):
+        """Write everything still queued."""
+        if self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join(timeout)
+
+    def _run(self):
+        self._scan()
+        while True:
+            item = self._queue.get()
+            if item is self._stop:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._count("errors", e)
+
+    def _scan(self):
+        # Images already in the archive count against the quota, oldest first
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = [e for e in os.scandir(self.directory) if e.is_file() and e.name.lower().endswith(ARCHIVE_EXTENSIONS)]
+        except OSError as e:
+            self._count("errors", e)
+            return
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            size = entry.stat().st_size
+            self._files.append((entry.path, size))
+            with self._lock:
+                self._total_bytes += size
+
+    def _write(self, path_stem, frame, rois, ng_rois, options, archived):
+        image_format, png_level, jpeg_quality = options
+        image = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        if rois:
+            draw_rois(image, rois, ng_rois)
+        if image_format == "jpeg":
+            path = path_stem + ".jpg"
+            ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        else:
+            path = path_stem + ".png"
+            ok, data = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, png_level])
+        if not ok:
+            raise RuntimeError(f"Could not encode {path}")
+        with open(path, "wb") as f:
+            f.write(data.tobytes())
+        self._count("written")
+        if archived:
+            self._files.append((path, len(data)))
+            with self._lock:
+                self._total_bytes += len(data)
+            self._enforce_quota()
+
+    def _enforce_quota(self):
+        while self._total_bytes > self.quota_bytes and len(self._files) > 1:
+            path, size = self._files.popleft()
+            with self._lock:
+                self._total_bytes -= size
+            try:
+                os.remove(path)
+                self._count("evicted")
+            except FileNotFoundError:
+                pass
+
+def draw_rois(image, rois, ng_rois):
+    """Outline every ROI on a BGR frame as inspected: red if it has an NG result, green otherwise."""
+    ng = set(ng_rois)
+    for roi in rois:
+        x, y, w, h, roi_id, _, shape = roi[:7]
+        color = (0, 0, 255) if roi_id in ng else (0, 200, 0)
+        if shape == "circle":
+            cv2.circle(image, (int(x + w / 2), int(y + h / 2)), min(w, h) // 2, color, 2)
+        else:
+            corners = np.array([roi_point(roi, u, v) for u, v in ((0, 0), (w, 0), (w, h), (0, h))], dtype=np.int32)
+            cv2.polylines(image, [corners], True, color, 2)
+        cv2.putText(image, str(roi_id), (int(x), max(12, int(y) - 5)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
@@ -0,0 +1,841 @@
+"""GUI-free inspection engine shared by the HMI and the offline batch runner.
+
+Every inspection takes an InspectionContext, an ROI tuple
+(x, y, w, h, id, angle, shape, mask) with mask a RoiMask, and a plain parameter
+mapping (the "params" section of a cycle config) and returns a result dict.
+Inspections see the ROI upright: rotated rectangles are resampled into a w x h
+crop, and circles are masked to their inscribed circle.
+"""
+import base64
+import json
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+import cv2
+import numpy as np
+
+# Fallback for configs saved before judgment criteria existed (same as the HMI defaults)
+DEFAULT_JUDGMENT_CRITERIA = {
+    "blob_count_min": 1.0,
+    "blob_count_max": 6.0,
+    "blob_area_min": 50.0,
+    "blob_area_max": 200.0,
+    "criteria_type": "At least one blob"
+}
+
+# Read-only copy of every cycle setting, taken on the Tk thread and shared with worker threads.
+# invalid_ranges lists the (min_key, max_key) params pairs where min > max; template is a
+# TemplateModel or None.
+Settings = namedtuple("Settings", ["params", "judgment_criteria", "blob_outputs", "cycle_features", "invalid_ranges", "template"],
+                      defaults=(None,))
+
+# Intensity statistics of the inspected pixels of an ROI (see InspectionContext.roi_stats)
+RoiStats = namedtuple("RoiStats", ["count", "mean", "std", "min", "max", "histogram", "laplacian_var"])
+
+def freeze_settings(params, judgment_criteria, blob_outputs, cycle_features, template=None):
+    params = dict(params)
+    invalid_ranges = tuple((key, f"{key[:-4]}_max") for key in params
+                           if key.endswith("_min") and f"{key[:-4]}_max" in params and params[key] > params[f"{key[:-4]}_max"])
+    return Settings(MappingProxyType(params),
+                    MappingProxyType(dict(DEFAULT_JUDGMENT_CRITERIA, **judgment_criteria)),
+                    MappingProxyType(dict(blob_outputs)),
+                    MappingProxyType(dict(cycle_features)),
+                    invalid_ranges,
+                    template)
+
+class RoiMask:
+    """h x w uint8 ROI mask (non-zero = inspected) with its pixel count and bounding box precomputed.
+
+    A mask is never modified in place; editing produces a new RoiMask. Masks
+    loaded from a config stay PNG-encoded until array is first read, and empty
+    masks never allocate an array at all, so inspections check empty instead of
+    scanning pixels.
+    """
+
+    __slots__ = ("shape", "pixel_count", "bbox", "_array", "_encoded")
+
+    def __init__(self, shape, pixel_count=0, bbox=None, array=None, encoded=None):
+        self.shape = tuple(shape)
+        self.pixel_count = pixel_count
+        self.bbox = tuple(bbox) if bbox else None  # (x, y, w, h) of the non-zero pixels
+        self._array = array
+        self._encoded = encoded
+
+    @classmethod
+    def blank(cls, h, w):
+        return cls((h, w))
+
+    @classmethod
+    def from_array(cls, array):
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        pixel_count = cv2.countNonZero(array)
+        return cls(array.shape, pixel_count, cv2.boundingRect(array) if pixel_count else None, array)
+
+    @property
+    def empty(self):
+        return self.pixel_count == 0
+
+    @property
+    def array(self):
+        if self._array is None:
+            self._array = decode_image(self._encoded) if self._encoded else np.zeros(self.shape, dtype=np.uint8)
+        return self._array
+
+    def resized(self, w, h):
+        if self.empty:
+            return RoiMask.blank(h, w)
+        return RoiMask.from_array(cv2.resize(self.array, (w, h), interpolation=cv2.INTER_NEAREST))
+
+    def to_json(self):
+        data = {"shape": list(self.shape), "count": int(self.pixel_count)}
+        if not self.empty:
+            data["bbox"] = [int(v) for v in self.bbox]
+            if self._encoded is None:
+                self._encoded = encode_image(self.array)
+            data["png"] = self._encoded
+        return data
+
+    @classmethod
+    def from_json(cls, data, shape=None):
+        """Accepts to_json output or the nested lists written by older configs."""
+        if isinstance(data, dict):
+            return cls(data["shape"], data.get("count", 0), data.get("bbox"), encoded=data.get("png"))
+        if data is None or len(data) == 0:
+            return cls.blank(*shape)
+        return cls.from_array(np.array(data, dtype=np.uint8))
+
+def roi_to_json(roi):
+    x, y, w, h, roi_id, angle, shape, mask = roi
+    return [x, y, w, h, roi_id, angle, shape, mask.to_json()]
+
+def roi_from_json(r):
+    return (r[0], r[1], r[2], r[3], r[4], r[5], r[6], RoiMask.from_json(r[7], (r[3], r[2])))
+
+def is_rotated(roi):
+    return roi[6] == "rectangle" and abs(roi[5]) > 1e-3
+
+@lru_cache(maxsize=64)
+def rotation_maps(x, y, w, h, angle):
+    """Fixed-point remap maps taking a rotated w x h rectangle of the frame to an upright crop.
+
+    Uses the same rotation about the ROI centre as the HMI overlay, so the crop is
+    exactly what is drawn. Built once per ROI geometry.
+    """
+    center = (x + w / 2, y + h / 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1)
+    u, v = np.meshgrid(np.arange(w, dtype=np.float32) + x - center[0], np.arange(h, dtype=np.float32) + y - center[1])
+    map_x = (M[0, 0] * u + M[0, 1] * v + center[0]).astype(np.float32)
+    map_y = (M[1, 0] * u + M[1, 1] * v + center[1]).astype(np.float32)
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+@lru_cache(maxsize=64)
+def circle_mask(w, h, mask):
+    """Inscribed circle of a circle ROI, intersected with the user mask if it has one."""
+    circle = np.zeros((h, w), dtype=np.uint8)
+    cv2.circle(circle, (w // 2, h // 2), min(w, h) // 2, 255, -1)
+    if not mask.empty and mask.shape == circle.shape:
+        circle &= mask.array
+    return RoiMask.from_array(circle)
+
+def effective_mask(roi):
+    """The RoiMask inspections apply: the user mask, restricted to the circle for circle ROIs."""
+    x, y, w, h, _, _, shape, mask = roi
+    return circle_mask(w, h, mask) if shape == "circle" else mask
+
+def roi_point(roi, u, v):
+    """Frame coordinates of point (u, v) of the upright ROI crop."""
+    x, y, w, h, _, angle = roi[:6]
+    if not is_rotated(roi):
+        return (u + x, v + y)
+    center = (x + w / 2, y + h / 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1)
+    px, py = u + x - center[0], v + y - center[1]
+    return (M[0, 0] * px + M[0, 1] * py + center[0], M[1, 0] * px + M[1, 1] * py + center[1])
+
+# Pyramid level each feature is processed at, by params key: 0 = full resolution,
+# 1 = half, 2 = quarter. Results are always reported in full-resolution units.
+# Focus and template matching are not scale-invariant (template matching has its own pyramid).
+SCALE_PARAMS = {
+    "Density": "density_scale",
+    "Contrast": "contrast_scale",
+    "Edge": "edge_scale",
+    "Contour Analysis": "contour_scale",
+    "Blob Detection": "blob_scale",
+    "Color Detection": "color_scale",
+    "Measurement": "measurement_scale"
+}
+MAX_SCALE_LEVEL = 2
+
+def scale_level(params, feature):
+    return min(MAX_SCALE_LEVEL, max(0, int(params.get(SCALE_PARAMS[feature], 0))))
+
+@lru_cache(maxsize=256)
+def scale_roi(roi, level):
+    """The ROI in the coordinates of pyramid level `level`, mask resized to match."""
+    x, y, w, h, roi_id, angle, shape, mask = roi
+    f = 2 ** level
+    w_s, h_s = max(1, w // f), max(1, h // f)
+    return (x // f, y // f, w_s, h_s, roi_id, angle, shape, mask.resized(w_s, h_s))
+
+def contour_edges_key(gaussian_blur=0, morph_kernel=0):
+    """Cache key of InspectionContext.contour_edges for these settings."""
+    if gaussian_blur <= 1 and morph_kernel <= 1:
+        return ("canny", 100, 200, 0)
+    return ("contour_edges", gaussian_blur, morph_kernel)
+
+class InspectionContext:
+    """Frame captured once per trigger, with per-ROI derived images computed on first use."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _cached(self, key, compute):
+        # Safe to share between worker threads: each derived image is computed once,
+        # concurrent requests for the same key wait for the first one
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    @staticmethod
+    def _roi_key(roi):
+        x, y, w, h, roi_id, angle, shape = roi[:7]
+        return (roi_id, x, y, w, h, angle, shape)
+
+    def crop(self, roi):
+        x, y, w, h = roi[:4]
+        if not is_rotated(roi):
+            # Clamp at 0 so an ROI hanging off the top or left edge is cut there like one
+            # off the bottom or right, instead of a negative start wrapping around
+            x0, y0 = max(x, 0), max(y, 0)
+            return self._cached(("crop",) + self._roi_key(roi), lambda: self.frame[y0:max(y + h, 0), x0:max(x + w, 0)])
+        def compute():
+            map1, map2 = rotation_maps(x, y, w, h, roi[5])
+            return cv2.remap(self.frame, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        return self._cached(("crop",) + self._roi_key(roi), compute)
+
+    def mask(self, roi):
+        """effective_mask(roi), cut like crop() where an upright ROI leaves the frame."""
+        mask = effective_mask(roi)
+        x, y, w, h = roi[:4]
+        rows, cols = self.frame.shape[:2]
+        if mask.empty or is_rotated(roi) or (x >= 0 and y >= 0 and x + w <= cols and y + h <= rows):
+            return mask
+        def compute():
+            x0, y0 = max(x, 0), max(y, 0)
+            cut = RoiMask.from_array(mask.array[y0 - y:max(min(y + h, rows) - y, 0), x0 - x:max(min(x + w, cols) - x, 0)])
+            if cut.empty:
+                # An empty RoiMask means "inspect everything", not "nothing left to inspect"
+                raise ValueError(f"Mask of ROI {roi[4]} lies entirely outside the frame")
+            return cut
+        return self._cached(("mask",) + self._roi_key(roi), compute)
+
+    def level(self, level):
+        """Context on the frame downsampled level times with pyrDown, built once per frame."""
+        if level <= 0:
+            return self
+        return self._cached(("level", level), lambda: InspectionContext(cv2.pyrDown(self.level(level - 1).frame)))
+
+    def at_scale(self, roi, level):
+        """(context, roi) for processing roi at 1 / 2**level of full resolution."""
+        if level <= 0:
+            return self, roi
+        return self.level(level), scale_roi(roi, level)
+
+    def gray(self, roi):
+        return self._cached(("gray",) + self._roi_key(roi), lambda: cv2.cvtColor(self.crop(roi), cv2.COLOR_RGB2GRAY))
+
+    def masked_gray(self, roi):
+        def compute():
+            gray = self.gray(roi)
+            mask = self.mask(roi)
+            if not mask.empty:
+                gray = cv2.bitwise_and(gray, gray, mask=mask.array)
+            return gray
+        return self._cached(("masked_gray",) + self._roi_key(roi), compute)
+
+    def integral(self):
+        """Summed-area tables (sum, sum of squares) of the whole gray frame, built once per frame."""
+        def compute():
+            gray = cv2.cvtColor(self.frame, cv2.COLOR_RGB2GRAY)
+            return cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        return self._cached(("integral",), compute)
+
+    def window_stats(self, x, y, w, h):
+        """(pixel count, mean, standard deviation) of a gray frame window, in O(1) from integral().
+
+        The window is clipped to the frame on every side, as crop() cuts an upright ROI.
+        """
+        total, squares = self.integral()
+        rows, cols = total.shape[0] - 1, total.shape[1] - 1
+        x0, x1 = min(max(x, 0), cols), min(max(x + w, 0), cols)
+        y0, y1 = min(max(y, 0), rows), min(max(y + h, 0), rows)
+        count = (x1 - x0) * (y1 - y0)
+        if count <= 0:
+            return 0, 0.0, 0.0
+        s = total[y1, x1] - total[y0, x1] - total[y1, x0] + total[y0, x0]
+        sq = squares[y1, x1] - squares[y0, x1] - squares[y1, x0] + squares[y0, x0]
+        mean = s / count
+        return count, float(mean), float(np.sqrt(max(0.0, sq / count - mean * mean)))
+
+    def intensity(self, roi):
+        """(mean, standard deviation) of the inspected gray pixels of roi.
+
+        Upright ROIs without a mask are read from the frame's summed-area tables, so
+        after the first one each costs the same whatever its size; anything else goes
+        through roi_stats().
+        """
+        if not is_rotated(roi) and self.mask(roi).empty:
+            _, mean, std = self.window_stats(*roi[:4])
+            return mean, std
+        stats = self.roi_stats(roi)
+        return stats.mean, stats.std
+
+    def roi_stats(self, roi):
+        """Masked gray statistics shared by density, contrast and focus, computed once per ROI.
+
+        Mean, standard deviation, min and max all come from one 256-bin histogram of the
+        pixels inside the mask (the whole ROI if it has none), so no pixel copies are
+        made and black pixels count like any other. The Laplacian is taken on the
+        unmasked gray image so the mask border does not read as an edge, and its
+        variance is measured over the same pixels.
+        """
+        def compute():
+            gray = self.gray(roi)
+            mask = self.mask(roi)
+            mask_array = None if mask.empty else mask.array
+            histogram = cv2.calcHist([gray], [0], mask_array, [256], [0, 256]).ravel()
+            count = float(histogram.sum())
+            if count == 0:
+                return RoiStats(0, 0.0, 0.0, 0, 0, histogram, 0.0)
+            levels = np.arange(256, dtype=np.float64)
+            mean = float(histogram @ levels) / count
+            variance = max(0.0, float(histogram @ (levels * levels)) / count - mean * mean)
+            present = np.flatnonzero(histogram)
+            # |Laplacian| of 8-bit data is at most 4 * 255, so 16-bit output is exact
+            laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+            _, laplacian_std = cv2.meanStdDev(laplacian, mask=mask_array)
+            return RoiStats(int(count), mean, float(np.sqrt(variance)), int(present[0]), int(present[-1]), histogram,
+                            float(laplacian_std[0, 0]) ** 2)
+        return self._cached(("stats",) + self._roi_key(roi), compute)
+
+    def hsv(self, roi):
+        return self._cached(("hsv",) + self._roi_key(roi), lambda: cv2.cvtColor(self.crop(roi), cv2.COLOR_RGB2HSV))
+
+    def pyramid(self, roi, levels):
+        """Grayscale ROI followed by levels - 1 successive pyrDown halvings."""
+        def compute():
+            images = [self.gray(roi)]
+            for _ in range(levels - 1):
+                images.append(cv2.pyrDown(images[-1]))
+            return images
+        return self._cached(("pyramid", levels) + self._roi_key(roi), compute)
+
+    def canny(self, roi, low, high, median_blur=0):
+        def compute():
+            gray = self.masked_gray(roi)
+            if median_blur:
+                gray = cv2.medianBlur(gray, median_blur)
+            return cv2.Canny(gray, low, high)
+        return self._cached(("canny", low, high, median_blur) + self._roi_key(roi), compute)
+
+    def contour_edges(self, roi, gaussian_blur=0, morph_kernel=0):
+        """Canny(100, 200) edges of the masked ROI, Gaussian-blurred before and closed after if asked.
+
+        With neither step this is the same image (and cache entry) as canny(roi, 100, 200).
+        """
+        if gaussian_blur <= 1 and morph_kernel <= 1:
+            return self.canny(roi, 100, 200)
+        def compute():
+            gray = self.masked_gray(roi)
+            if gaussian_blur > 1:
+                gray = cv2.GaussianBlur(gray, (gaussian_blur, gaussian_blur), 0)
+            edges = cv2.Canny(gray, 100, 200)
+            if morph_kernel > 1:
+                edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((morph_kernel, morph_kernel), np.uint8))
+            return edges
+        return self._cached(contour_edges_key(gaussian_blur, morph_kernel) + self._roi_key(roi), compute)
+
+    def find_contours(self, roi, key, binary, mode=cv2.RETR_EXTERNAL):
+        """(contours, hierarchy) of a binary ROI image, cached under its preprocessing key.
+
+        key identifies how the binary image was made (e.g. ("canny", 100, 200, 0)) and
+        binary is a callable returning it, only called on a miss. Checks whose
+        preprocessing matches therefore share one findContours pass per frame.
+        """
+        return self._cached(("contours", mode) + tuple(key) + self._roi_key(roi),
+                            lambda: cv2.findContours(binary(), mode, cv2.CHAIN_APPROX_SIMPLE))
+
+def make_result(roi, inspection_type, result, value, details, limits=None, **artifacts):
+    # limits: (lower, upper) band value was judged against, None for an open side (used for SPC)
+    # artifacts hold images/contours for previews; they are not serialised
+    return {
+        "roi_id": roi[4],
+        "inspection_type": inspection_type,
+        "result": result,
+        "value": float(value),
+        "details": details,
+        "limits": limits,
+        "artifacts": artifacts
+    }
+
+def inspect_density(ctx, roi, params):
+    ctx, roi = ctx.at_scale(roi, scale_level(params, "Density"))
+    mean_density, _ = ctx.intensity(roi)
+    min_density, max_density = params["density_threshold_min"], params["density_threshold_max"]
+    result = "OK" if min_density <= mean_density <= max_density else "NG"
+    details = f"Mean Density: {mean_density:.2f} (Range: [{min_density}, {max_density}])"
+    return make_result(roi, "Density Inspection", result, mean_density, details, (min_density, max_density))
+
+def inspect_contrast(ctx, roi, params):
+    ctx, roi = ctx.at_scale(roi, scale_level(params, "Contrast"))
+    _, contrast = ctx.intensity(roi)
+    min_contrast, max_contrast = params["contrast_threshold_min"], params["contrast_threshold_max"]
+    result = "OK" if min_contrast <= contrast <= max_contrast else "NG"
+    details = f"Contrast: {contrast:.2f} (Range: [{min_contrast}, {max_contrast}])"
+    return make_result(roi, "Contrast Inspection", result, contrast, details, (min_contrast, max_contrast))
+
+def inspect_edge(ctx, roi, params):
+    level = scale_level(params, "Edge")
+    ctx, roi = ctx.at_scale(roi, level)
+    edges = ctx.canny(roi, params["edge_canny_low"], params["edge_canny_high"], int(params["edge_median_blur"]))
+    # Edge pixels scale with length, so one pixel at level n stands for 2**n at full resolution
+    edge_sum = cv2.countNonZero(edges) * 2 ** level
+    min_edge, max_edge = params["edge_threshold_min"], params["edge_threshold_max"]
+    result = "OK" if min_edge <= edge_sum <= max_edge else "NG"
+    details = f"Edge Sum: {edge_sum:.2f} (Range: [{min_edge}, {max_edge}])"
+    return make_result(roi, "Edge Inspection", result, edge_sum, details, (min_edge, max_edge), edges=edges)
+
+def contour_stats(contours):
+    """Polygon area and (x, y, w, h) bounding box of every contour in one vectorised pass.
+
+    Gives the same values as cv2.contourArea and cv2.boundingRect per contour.
+    """
+    if not contours:
+        return np.zeros(0), np.zeros((0, 4), dtype=np.int64)
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=len(contours))
+    starts = np.zeros(len(contours), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    # Shoelace formula; each contour's last point wraps to its first
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    areas = np.abs(np.add.reduceat(cross, starts)) / 2.0
+    mins = np.minimum.reduceat(points, starts, axis=0)
+    maxs = np.maximum.reduceat(points, starts, axis=0)
+    boxes = np.hstack([mins, maxs - mins + 1])
+    return areas, boxes
+
+def blob_binary_key(params):
+    """Every parameter that changes the blob binary image, for the contour cache."""
+    mode = params["blob_color_mode"]
+    if mode == "Grayscale":
+        threshold = (params["blob_threshold_manual"], params["blob_threshold_value"] if params["blob_threshold_manual"] else None)
+    elif mode == "RGB":
+        threshold = tuple(params[f"blob_rgb_{c}_{b}"] for c in "bgr" for b in ("min", "max"))
+    else:
+        threshold = tuple(params[f"blob_hsv_{c}_{b}"] for c in "hsv" for b in ("min", "max"))
+    return ("blob", mode) + threshold + (params["blob_bilateral_sigma"],)
+
+def blob_binary(ctx, roi, params):
+    mask = ctx.mask(roi)
+    if params["blob_color_mode"] == "Grayscale":
+        gray = ctx.gray(roi)
+        if params["blob_threshold_manual"]:
+            thresh = cv2.threshold(gray, params["blob_threshold_value"], 255, cv2.THRESH_BINARY)[1]
+        else:
+            thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    elif params["blob_color_mode"] == "RGB":
+        lower_rgb = (params["blob_rgb_b_min"], params["blob_rgb_g_min"], params["blob_rgb_r_min"])
+        upper_rgb = (params["blob_rgb_b_max"], params["blob_rgb_g_max"], params["blob_rgb_r_max"])
+        thresh = cv2.inRange(ctx.crop(roi), lower_rgb, upper_rgb)
+    else:  # HSV
+        hsv = ctx.hsv(roi)
+        lower_hsv = (params["blob_hsv_h_min"], params["blob_hsv_s_min"], params["blob_hsv_v_min"])
+        upper_hsv = (params["blob_hsv_h_max"], params["blob_hsv_s_max"], params["blob_hsv_v_max"])
+        thresh = cv2.inRange(hsv, lower_hsv, upper_hsv)
+    if not mask.empty:
+        thresh = thresh & mask.array
+    # Apply bilateral filter
+    return cv2.bilateralFilter(thresh, 11, params["blob_bilateral_sigma"], params["blob_bilateral_sigma"])
+
+def inspect_blobs(ctx, roi, params, judgment_criteria):
+    full_roi = roi
+    x, y, w, h = roi[:4]
+    level = scale_level(params, "Blob Detection")
+    s = 2 ** level  # lengths measured at this level are multiplied by s, areas by s * s
+    ctx, roi = ctx.at_scale(roi, level)
+    # Find contours
+    contours, _ = ctx.find_contours(roi, blob_binary_key(params), lambda: blob_binary(ctx, roi, params))
+    # Filter contours: cheap size filters on all contours at once, shape filters only on survivors
+    filtered_blobs = []
+    filtered_areas = []
+    blob_measurements = {
+        "count": 0,
+        "largest_area": 0,
+        "smallest_area": float("inf"),
+        "center_of_gravity": [],
+        "positions": [],
+        "orientation": [],
+        "total_area": 0,
+        "fill_percentage": 0
+    }
+    areas, boxes = contour_stats(contours)
+    if s > 1:
+        areas, boxes = areas * (s * s), boxes * s
+    widths, heights = boxes[:, 2], boxes[:, 3]
+    keep = ((params["blob_area_min"] <= areas) & (areas <= params["blob_area_max"]) &
+            (params["blob_width_min"] <= widths) & (widths <= params["blob_width_max"]) &
+            (params["blob_height_min"] <= heights) & (heights <= params["blob_height_max"]))
+    aspect_ratios = widths / np.maximum(heights, 1)
+    keep &= (params["blob_aspect_ratio_min"] <= aspect_ratios) & (aspect_ratios <= params["blob_aspect_ratio_max"])
+    if params["boundary_exclusion"]:
+        keep &= ((boxes[:, 0] > 2) & (boxes[:, 1] > 2) &
+                 (boxes[:, 0] + widths < w - 2) & (boxes[:, 1] + heights < h - 2))
+    circularity_min, circularity_max = params["blob_circularity_min"], params["blob_circularity_max"]
+    solidity_min, solidity_max = params["blob_solidity_min"], params["blob_solidity_max"]
+    bounding_shape = params["blob_bounding_shape"]
+    for i in np.flatnonzero(keep):
+        contour = contours[i]
+        area = float(areas[i])
+        x_b, y_b, w_b, h_b = (int(v) for v in boxes[i])
+        # Shape filters
+        perimeter = cv2.arcLength(contour, True) * s
+        circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0
+        if not (circularity_min <= circularity <= circularity_max):
+            continue
+        hull = cv2.convexHull(contour)
+        hull_area = cv2.contourArea(hull) * s * s
+        solidity = area / hull_area if hull_area > 0 else 0
+        if not (solidity_min <= solidity <= solidity_max):
+            continue
+        # Bounding shape match
+        if bounding_shape == "Rectangle":
+            rect = cv2.minAreaRect(contour)
+            box = cv2.boxPoints(rect)
+            box_area = cv2.contourArea(np.int32([box])) * s * s
+            if box_area == 0 or area / box_area < 0.8:
+                continue
+        elif bounding_shape == "Circle":
+            (cx, cy), radius = cv2.minEnclosingCircle(contour)
+            circle_area = np.pi * (radius * s) ** 2
+            if circle_area == 0 or area / circle_area < 0.8:
+                continue
+        filtered_blobs.append(contour * s if s > 1 else contour)
+        filtered_areas.append(area)
+        # Update measurements
+        blob_measurements["count"] += 1
+        blob_measurements["largest_area"] = max(blob_measurements["largest_area"], area)
+        blob_measurements["smallest_area"] = min(blob_measurements["smallest_area"], area)
+        M = cv2.moments(contour)
+        cx = M["m10"] / M["m00"] if M["m00"] > 0 else 0
+        cy = M["m01"] / M["m00"] if M["m00"] > 0 else 0
+        blob_measurements["center_of_gravity"].append(roi_point(full_roi, cx * s, cy * s))
+        blob_measurements["positions"].append((x_b + x, y_b + y, w_b, h_b))
+        if len(contour) >= 5:
+            ellipse = cv2.fitEllipse(contour)
+            blob_measurements["orientation"].append(ellipse[2])
+        blob_measurements["total_area"] += area
+    if blob_measurements["count"] > 0:
+        blob_measurements["fill_percentage"] = blob_measurements["total_area"] / (w * h) * 100
+    else:
+        blob_measurements["smallest_area"] = 0
+    # Judgment criteria
+    result = "OK"
+    details = []
+    if judgment_criteria["criteria_type"] == "At least one blob":
+        count_limits = (1, None)
+        if blob_measurements["count"] < 1:
+            result = "NG"
+            details.append("No blobs detected")
+    else:  # Blob count limit
+        count_limits = (judgment_criteria["blob_count_min"], judgment_criteria["blob_count_max"])
+        if not (judgment_criteria["blob_count_min"] <= blob_measurements["count"] <= judgment_criteria["blob_count_max"]):
+            result = "NG"
+            details.append(f"Blob count {blob_measurements['count']} outside range [{judgment_criteria['blob_count_min']}, {judgment_criteria['blob_count_max']}]")
+    for area in filtered_areas:
+        if not (judgment_criteria["blob_area_min"] <= area <= judgment_criteria["blob_area_max"]):
+            result = "NG"
+            details.append(f"Blob area {area:.1f} outside range [{judgment_criteria['blob_area_min']}, {judgment_criteria['blob_area_max']}]")
+    res = make_result(full_roi, "Blob Detection", result, blob_measurements["count"], "; ".join(details) or "Passed", count_limits,
+                      contours=filtered_blobs)
+    res["measurements"] = blob_measurements
+    return res
+
+def inspect_color(ctx, roi, params):
+    ctx, roi = ctx.at_scale(roi, scale_level(params, "Color Detection"))
+    x, y, w, h = roi[:4]
+    mask = ctx.mask(roi)
+    hsv = ctx.hsv(roi)
+    lower = (params["color_hue_min"], params["color_saturation_min"], params["color_brightness_min"])
+    upper = (params["color_hue_max"], params["color_saturation_max"], params["color_brightness_max"])
+    if mask.empty:
+        color_mask = cv2.inRange(hsv, lower, upper)
+    else:
+        # Only the mask's bounding box can contain selected pixels
+        bx, by, bw, bh = mask.bbox
+        color_mask = np.zeros((h, w), dtype=np.uint8)
+        window = color_mask[by:by+bh, bx:bx+bw]
+        cv2.inRange(hsv[by:by+bh, bx:bx+bw], lower, upper, dst=window)
+        cv2.bitwise_and(window, mask.array[by:by+bh, bx:bx+bw], dst=window)
+    ratio = cv2.countNonZero(color_mask) / (w * h) * 100
+    min_ratio, max_ratio = params["color_ratio_min"], params["color_ratio_max"]
+    result = "OK" if min_ratio <= ratio <= max_ratio else "NG"
+    details = f"Color Ratio: {ratio:.2f}% (Range: [{min_ratio}, {max_ratio}])"
+    return make_result(roi, "Color Detection", result, ratio, details, (min_ratio, max_ratio), color_mask=color_mask)
+
+def inspect_measurement(ctx, roi, params):
+    x, y, w, h = roi[:4]
+    level = scale_level(params, "Measurement")
+    s = 2 ** level
+    ctx, roi = ctx.at_scale(roi, level)
+    contours, _ = ctx.find_contours(roi, contour_edges_key(), lambda: ctx.contour_edges(roi))
+    min_area, max_area = w * h * params["measurement_tolerance_min"], w * h * params["measurement_tolerance_max"]
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        area = cv2.contourArea(largest_contour) * s * s
+        if s > 1:
+            largest_contour = largest_contour * s
+        result = "OK" if min_area <= area <= max_area else "NG"
+        details = f"Area: {area:.2f} px² (Range: [{min_area:.2f}, {max_area:.2f}])"
+    else:
+        largest_contour = None
+        area = 0
+        result = "NG"
+        details = "No contours found"
+    return make_result(roi, "Measurement", result, area, details, (min_area, max_area), contour=largest_contour)
+
+CONTOUR_RETRIEVAL_MODES = {"External": cv2.RETR_EXTERNAL, "All": cv2.RETR_LIST}
+
+def inspect_contours(ctx, roi, params):
+    """Judge the largest contour of the ROI edge map on area, perimeter and circularity."""
+    gaussian_blur, morph_kernel = int(params["contour_gaussian_blur"]), int(params["contour_morph_kernel"])
+    mode = CONTOUR_RETRIEVAL_MODES.get(params["contour_hierarchy_mode"], cv2.RETR_EXTERNAL)
+    level = scale_level(params, "Contour Analysis")
+    s = 2 ** level
+    ctx, roi = ctx.at_scale(roi, level)
+    area_limits = (params["contour_area_threshold_min"], params["contour_area_threshold_max"])
+    contours, _ = ctx.find_contours(roi, contour_edges_key(gaussian_blur, morph_kernel),
+                                    lambda: ctx.contour_edges(roi, gaussian_blur, morph_kernel), mode)
+    if not contours:
+        return make_result(roi, "Contour Analysis", "NG", 0, "No contours found", area_limits, contours=[])
+    if s > 1:
+        contours = [contour * s for contour in contours]
+    areas, _ = contour_stats(contours)
+    largest = int(np.argmax(areas))
+    area = float(areas[largest])
+    perimeter = cv2.arcLength(contours[largest], True)
+    circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0
+    checks = [("Area", area) + area_limits,
+              ("Perimeter", perimeter, params["contour_perimeter_min"], params["contour_perimeter_max"]),
+              ("Circularity", circularity, params["contour_circularity_min"], params["contour_circularity_max"])]
+    failed = [name for name, value, low, high in checks if not (low <= value <= high)]
+    result = "NG" if failed else "OK"
+    details = f"{len(contours)} contours, largest: " + ", ".join(f"{name} {value:.2f} [{low}, {high}]" for name, value, low, high in checks)
+    if failed:
+        details += f" ({', '.join(failed)} out of range)"
+    return make_result(roi, "Contour Analysis", result, area, details, area_limits, contours=contours, largest=contours[largest])
+
+def inspect_focus(ctx, roi, params):
+    laplacian_var = ctx.roi_stats(roi).laplacian_var
+    min_focus, max_focus = params["focus_threshold_min"], params["focus_threshold_max"]
+    result = "OK" if min_focus <= laplacian_var <= max_focus else "NG"
+    details = f"Focus Variance: {laplacian_var:.2f} (Range: [{min_focus}, {max_focus}])"
+    return make_result(roi, "Focus Check", result, laplacian_var, details, (min_focus, max_focus))
+
+class TemplateModel:
+    """Grayscale template and its pyramid, built once when the template is set.
+
+    Levels stop before the template's short side drops below min_side pixels, so the
+    coarse search still has enough structure to find the right candidates.
+    """
+
+    def __init__(self, image, min_side=12, max_levels=5):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        self.image = image
+        self.levels = [np.ascontiguousarray(gray)]
+        while len(self.levels) < max_levels and min(self.levels[-1].shape) // 2 >= min_side:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+# Above this many template pixels (at the level being searched) the full search uses the DFT path
+FFT_TEMPLATE_AREA = 32 * 32
+
+def match_template_fft(image, template):
+    """Same result as cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED), computed in the frequency domain.
+
+    Cost depends on the image size only, not the template size.
+    """
+    h, w = image.shape
+    th, tw = template.shape
+    n = th * tw
+    image = image.astype(np.float32)
+    zero_mean = template.astype(np.float32) - float(template.mean())
+    dft_h, dft_w = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+    padded_image = np.zeros((dft_h, dft_w), np.float32)
+    padded_image[:h, :w] = image
+    padded_template = np.zeros((dft_h, dft_w), np.float32)
+    padded_template[:th, :tw] = zero_mean
+    spectrum = cv2.mulSpectrums(cv2.dft(padded_image), cv2.dft(padded_template), 0, conjB=True)
+    numerator = cv2.idft(spectrum, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)[:h - th + 1, :w - tw + 1]
+    # Window sums of I and I^2 from integral images give each window's variance term
+    sums, sq_sums = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+    def window(s):
+        return s[th:, tw:] - s[:-th, tw:] - s[th:, :-tw] + s[:-th, :-tw]
+    window_var = window(sq_sums) - window(sums) ** 2 / n
+    denominator = np.sqrt(np.maximum(window_var, 0) * float((zero_mean ** 2).sum()))
+    scores = np.zeros_like(numerator)
+    valid = denominator > 1e-6
+    scores[valid] = numerator[valid] / denominator[valid]
+    return np.clip(scores, -1.0, 1.0)
+
+def _match(image, template):
+    if template.size >= FFT_TEMPLATE_AREA and image.size > 4 * template.size:
+        return match_template_fft(image, template)
+    return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+
+def _top_candidates(scores, count, radius):
+    scores = scores.copy()
+    candidates = []
+    for _ in range(count):
+        _, score, _, (cx, cy) = cv2.minMaxLoc(scores)
+        if candidates and score < candidates[0][0] * 0.5:
+            break
+        candidates.append((score, cx, cy))
+        scores[max(0, cy - radius):cy + radius + 1, max(0, cx - radius):cx + radius + 1] = -1.0
+    return candidates
+
+def match_template(image_levels, template, candidates=3, margin=3):
+    """Coarse-to-fine search of template (a TemplateModel) in an image pyramid.
+
+    The full search only runs on the coarsest level both pyramids share; each
+    candidate found there is then refined inside a small window at every finer
+    level. Returns (score, x, y) of the best match at full resolution, or None if
+    the template does not fit in the image.
+    """
+    levels = min(len(template.levels), len(image_levels))
+    while levels > 1 and any(i < t for i, t in zip(image_levels[levels - 1].shape, template.levels[levels - 1].shape)):
+        levels -= 1
+    top = levels - 1
+    image, tmpl = image_levels[top], template.levels[top]
+    if image.shape[0] < tmpl.shape[0] or image.shape[1] < tmpl.shape[1]:
+        return None
+    best = None
+    for score, x, y in _top_candidates(_match(image, tmpl), candidates, max(1, min(tmpl.shape) // 2)):
+        for level in range(top - 1, -1, -1):
+            image, tmpl = image_levels[level], template.levels[level]
+            th, tw = tmpl.shape
+            x0 = min(max(0, 2 * x - margin), image.shape[1] - tw)
+            y0 = min(max(0, 2 * y - margin), image.shape[0] - th)
+            x1 = min(image.shape[1], 2 * x + margin + tw)
+            y1 = min(image.shape[0], 2 * y + margin + th)
+            window = cv2.matchTemplate(image[y0:y1, x0:x1], tmpl, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(window)
+            x, y = x0 + dx, y0 + dy
+        if best is None or score > best[0]:
+            best = (score, x, y)
+    return best
+
+def inspect_template(ctx, roi, params, template):
+    x, y, w, h = roi[:4]
+    min_score, max_score = params["template_threshold_min"], params["template_threshold_max"]
+    if template is None:
+        return make_result(roi, "Template Matching", "NG", 0, "No template set", (min_score, max_score))
+    th, tw = template.shape
+    found = match_template(ctx.pyramid(roi, len(template.levels)), template) if th <= h and tw <= w else None
+    if found is None:
+        return make_result(roi, "Template Matching", "NG", 0, f"Template {tw}x{th} larger than ROI {w}x{h}", (min_score, max_score))
+    score, mx, my = found
+    result = "OK" if min_score <= score <= max_score else "NG"
+    fx, fy = roi_point(roi, mx, my)
+    details = f"Match Score: {score:.3f} at ({fx:.0f}, {fy:.0f}) (Range: [{min_score}, {max_score}])"
+    res = make_result(roi, "Template Matching", result, score, details, (min_score, max_score), box=(mx, my, tw, th))
+    res["location"] = (fx, fy, tw, th)
+    return res
+
+# cycle_features name -> inspection taking (ctx, roi, settings)
+INSPECTIONS = {
+    "Density": lambda ctx, roi, settings: inspect_density(ctx, roi, settings.params),
+    "Contrast": lambda ctx, roi, settings: inspect_contrast(ctx, roi, settings.params),
+    "Edge": lambda ctx, roi, settings: inspect_edge(ctx, roi, settings.params),
+    "Template Matching": lambda ctx, roi, settings: inspect_template(ctx, roi, settings.params, settings.template),
+    "Contour Analysis": lambda ctx, roi, settings: inspect_contours(ctx, roi, settings.params),
+    "Blob Detection": lambda ctx, roi, settings: inspect_blobs(ctx, roi, settings.params, settings.judgment_criteria),
+    "Color Detection": lambda ctx, roi, settings: inspect_color(ctx, roi, settings.params),
+    "Measurement": lambda ctx, roi, settings: inspect_measurement(ctx, roi, settings.params),
+    "Focus Check": lambda ctx, roi, settings: inspect_focus(ctx, roi, settings.params)
+}
+
+def cycle_jobs(rois, cycle_features):
+    return [(roi, feature) for roi in rois for feature, enabled in cycle_features.items()
+            if enabled and feature in INSPECTIONS]
+
+def submit_cycle(executor, ctx, rois, settings, metrics=None):
+    """Queue every ROI x feature job on executor; futures come back in ROI then feature order.
+
+    With metrics (a metrics.Metrics) each job's duration is recorded under its feature name.
+    executor may also be a process_pool.ProcessInspectionPool, which takes the whole cycle.
+    """
+    if hasattr(executor, "submit_cycle"):
+        return executor.submit_cycle(ctx, rois, settings, metrics)
+    def job(feature):
+        return metrics.timed(feature, INSPECTIONS[feature]) if metrics else INSPECTIONS[feature]
+    return [executor.submit(job(feature), ctx, roi, settings)
+            for roi, feature in cycle_jobs(rois, settings.cycle_features)]
+
+def overall_verdict(results):
+    return "NG" if any(r["result"] == "NG" for r in results) else "OK"
+
+def run_cycle(frame, rois, settings, executor=None):
+    """Run every enabled feature on every ROI of one RGB frame.
+
+    With an executor (e.g. a ThreadPoolExecutor) the jobs run concurrently; the
+    OpenCV calls release the GIL. Returns (overall_result, results) with results
+    in ROI then feature order either way.
+    """
+    ctx = InspectionContext(frame)
+    if executor is None:
+        results = [INSPECTIONS[feature](ctx, roi, settings)
+                   for roi, feature in cycle_jobs(rois, settings.cycle_features)]
+    else:
+        results = [f.result() for f in submit_cycle(executor, ctx, rois, settings)]
+    return overall_verdict(results), results
+
+def load_cycle_config(path):
+    """Read a save_cycle_config JSON file into (Settings, rois)."""
+    with open(path, "r") as f:
+        config = json.load(f)
+    rois = [roi_from_json(r) for r in config["rois"]]
+    template = TemplateModel(decode_image(config["template"])) if config.get("template") else None
+    settings = freeze_settings(config["params"], config.get("judgment_criteria", {}),
+                               config.get("blob_outputs", {}), config["cycle_features"], template)
+    return settings, rois
+
+def encode_image(image):
+    """RGB or grayscale image -> base64 PNG text for a JSON config."""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    ok, png = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("Could not encode image")
+    return base64.b64encode(png.tobytes()).decode("ascii")
+
+def decode_image(text):
+    """Inverse of encode_image."""
+    image = cv2.imdecode(np.frombuffer(base64.b64decode(text), np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image.ndim == 3 else image
@@ -0,0 +1,100 @@
+"""Indexed SQLite store of inspection results, with paged queries and CSV export."""
+import csv
+import sqlite3
+from datetime import datetime
+
+COLUMNS = ("id", "ts", "cycle_id", "roi_id", "inspection_type", "result", "value", "details")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    cycle_id INTEGER,
+    roi_id INTEGER,
+    inspection_type TEXT NOT NULL,
+    result TEXT NOT NULL,
+    value REAL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_ts ON results (ts);
+CREATE INDEX IF NOT EXISTS idx_results_roi ON results (roi_id, id);
+CREATE INDEX IF NOT EXISTS idx_results_type ON results (inspection_type, id);
+CREATE INDEX IF NOT EXISTS idx_results_result ON results (result, id);
+CREATE INDEX IF NOT EXISTS idx_results_cycle ON results (cycle_id);
+"""
+
+class InspectionHistory:
+    """One connection to the history database; create one per thread.
+
+    Rows are returned newest first. Paging is keyset based (id < before_id), so
+    every page costs the same no matter how deep into the history it is.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def insert_many(self, records):
+        """records: iterables of (ts, cycle_id, roi_id, inspection_type, result, value, details)."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO results (ts, cycle_id, roi_id, inspection_type, result, value, details) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                records)
+
+    def last_cycle_id(self):
+        return self.conn.execute("SELECT MAX(cycle_id) FROM results").fetchone()[0] or 0
+
+    @staticmethod
+    def _where(filters, before_id=None):
+        clauses, args = [], []
+        if filters.get("roi_id") is not None:
+            clauses.append("roi_id = ?")
+            args.append(filters["roi_id"])
+        if filters.get("inspection_type"):
+            clauses.append("inspection_type = ?")
+            args.append(filters["inspection_type"])
+        if filters.get("result"):
+            clauses.append("result = ?")
+            args.append(filters["result"])
+        if filters.get("start") is not None:
+            clauses.append("ts >= ?")
+            args.append(filters["start"])
+        if filters.get("end") is not None:
+            clauses.append("ts < ?")
+            args.append(filters["end"])
+        if before_id is not None:
+            clauses.append("id < ?")
+            args.append(before_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def page(self, filters, before_id=None, limit=100):
+        """Up to limit rows matching filters, newest first, older than before_id if given."""
+        where, args = self._where(filters, before_id)
+        return self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM results{where} ORDER BY id DESC LIMIT ?",
+                                 args + [limit]).fetchall()
+
+    def inspection_types(self):
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT inspection_type FROM results ORDER BY inspection_type")]
+
+    def export_csv(self, filename, filters):
+        """Stream every matching row to a CSV file, oldest first. Returns the row count."""
+        where, args = self._where(filters)
+        count = 0
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Timestamp", "Cycle ID", "ROI ID", "Inspection Type", "Result", "Value", "Details"])
+            cursor = self.conn.execute(
+                f"SELECT ts, cycle_id, roi_id, inspection_type, result, value, details FROM results{where} ORDER BY id", args)
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                writer.writerows([datetime.fromtimestamp(r[0]).strftime("%Y-%m-%d %H:%M:%S"), *r[1:]] for r in rows)
+                count += len(rows)
+        return count
@@ -0,0 +1,119 @@
+"""Rolling per-stage timings with percentile summaries and a Prometheus text export."""
+import os
+import threading
+import time
+from collections import deque
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class StageTimer:
+    """Context manager that records the time spent in its block under one stage name."""
+
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """Per-stage durations in seconds, kept as the last window observations per stage.
+
+    Recording is a deque append under a lock; percentiles are only computed when a
+    summary or the metrics file is requested. With enabled False nothing is recorded.
+    Safe to use from the Tk thread, the capture thread and inspection workers at once.
+    """
+
+    def __init__(self, window=1000, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self._samples = {}
+        self._totals = {}  # stage -> [count, sum], cumulative as Prometheus expects
+        self._ends = {}  # stage -> recent observation end times, for rates such as FPS
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0, 0.0]
+                self._ends[stage] = deque(maxlen=30)
+            samples.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+            self._ends[stage].append(now)
+
+    def time(self, stage):
+        return StageTimer(self, stage)
+
+    def timed(self, stage, fn):
+        """Wrap fn so every call is recorded under stage."""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.observe(stage, time.perf_counter() - start)
+        return wrapper
+
+    def last(self, stage):
+        with self._lock:
+            samples = self._samples.get(stage)
+            return samples[-1] if samples else None
+
+    def rate(self, stage):
+        """Observations per second over the most recent ones (e.g. display FPS)."""
+        with self._lock:
+            ends = self._ends.get(stage)
+            if not ends or len(ends) < 2 or ends[-1] == ends[0]:
+                return 0.0
+            return (len(ends) - 1) / (ends[-1] - ends[0])
+
+    def summary(self):
+        """{stage: {"count", "p50_ms", "p95_ms", "p99_ms"}} over each stage's window."""
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self._samples.items()}
+        summary = {}
+        for stage, samples in snapshot.items():
+            if not samples:
+                continue
+            summary[stage] = {"count": len(samples)}
+            for q in QUANTILES:
+                summary[stage][f"p{int(q * 100)}_ms"] = samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+        return summary
+
+    def write_prometheus(self, path, gauges=None, prefix="visionmaster"):
+        """Write every stage as a summary metric, plus optional {name: value} gauges.
+
+        The file is replaced atomically so a scraper never reads half of it.
+        """
+        with self._lock:
+            snapshot = {stage: (sorted(samples), tuple(self._totals[stage])) for stage, samples in self._samples.items()}
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each processing stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, (samples, (count, total)) in sorted(snapshot.items()):
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            for q in QUANTILES:
+                value = samples[min(len(samples) - 1, int(len(samples) * q))] if samples else float("nan")
+                lines.append(f'{prefix}_stage_seconds{{stage="{label}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{label}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{label}"}} {count}')
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
@@ -0,0 +1,235 @@
+"""Continuous inspection as a staged pipeline: capture, preprocess, inspect, judge."""
+import threading
+import time
+from collections import deque
+from inspection_engine import INSPECTIONS, InspectionContext, cycle_jobs, overall_verdict, submit_cycle
+
+STAGES = ("capture", "preprocess", "inspect", "judge")
+BACKPRESSURE_POLICIES = ("drop oldest", "block", "flag overrun")
+
+class Part:
+    """One frame on its way through the pipeline."""
+
+    __slots__ = ("seq", "capture_ts", "frame", "ctx", "results", "verdict", "error", "done_ts")
+
+    def __init__(self, seq, capture_ts, frame):
+        self.seq = seq
+        self.capture_ts = capture_ts
+        self.frame = frame
+        self.ctx = None
+        self.results = []
+        self.verdict = None
+        self.error = None  # exception message of the stage that failed; the part is then NG
+        self.done_ts = None
+
+class StageQueue:
+    """Bounded hand-off between two stages.
+
+    When full, put() follows policy: "block" waits for room, "drop oldest" evicts the
+    oldest waiting part to make room, "flag overrun" refuses the new part. put()
+    returns the part that did not get through (or None) so the caller can count it.
+    """
+
+    def __init__(self, maxsize, policy="drop oldest"):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy!r}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            rejected = None
+            if len(self._items) >= self.maxsize:
+                if self.policy == "block":
+                    self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed)
+                elif self.policy == "drop oldest":
+                    rejected = self._items.popleft()
+                else:
+                    return item
+            if self._closed:
+                return item
+            self._items.append(item)
+            self._cond.notify_all()
+            return rejected
+
+    def get(self, timeout=0.2):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout) or not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+class InspectionPipeline:
+    """Overlaps capture and processing for continuously moving parts; every frame is a part.
+
+    Each stage runs on its own thread, linked by StageQueues of queue_size parts:
+    capture calls source() for the next (timestamp, RGB frame), or None if there is no
+    new frame yet; preprocess builds the InspectionContext and the per-ROI gray/HSV
+    images; inspect runs every enabled feature (on executor if given); judge sets the
+    verdict. on_part(part) is called from the judge thread for every judged part.
+    Parts dropped or refused under backpressure were never inspected, so they are only
+    counted ("dropped", "overruns"), not judged. rois and settings are fixed for the
+    life of the pipeline.
+    """
+
+    def __init__(self, source, rois, settings, on_part, queue_size=2, policy="drop oldest", executor=None, metrics=None):
+        self.source = source
+        self.rois = list(rois)
+        self.settings = settings
+        self.on_part = on_part
+        self.executor = executor
+        self.metrics = metrics
+        self.queues = [StageQueue(queue_size, policy) for _ in STAGES[1:]]
+        self.counters = {"captured": 0, "completed": 0, "dropped": 0, "overruns": 0, "errors": 0}
+        self.last_error = None  # message of the latest on_part failure
+        self._busy = dict.fromkeys(STAGES, 0.0)
+        self._completions = deque(maxlen=10000)
+        self._last_sample = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+        self._started = None
+
+    def start(self):
+        self._running = True
+        self._started = time.monotonic()
+        self._last_sample = (self._started, dict(self._busy))
+        workers = [self._capture, self._preprocess, self._inspect, self._judge]
+        self._threads = [threading.Thread(target=worker, name=f"pipeline-{stage}", daemon=True) for stage, worker in zip(STAGES, workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        for q in self.queues:
+            q.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    @property
+    def running(self):
+        return self._running
+
+    def _account(self, stage, seconds):
+        with self._lock:
+            self._busy[stage] += seconds
+        if self.metrics:
+            self.metrics.observe(f"pipeline {stage}", seconds)
+
+    def _hand_off(self, index, part):
+        rejected = self.queues[index].put(part)
+        if rejected is not None and self._running:
+            with self._lock:
+                self.counters["dropped" if self.queues[index].policy == "drop oldest" else "overruns"] += 1
+
+    def _stage(self, index, stage, work):
+        # Generic loop for every stage after capture: take a part, work on it, pass it on
+        while self._running:
+            part = self.queues[index - 1].get()
+            if part is None:
+                continue
+            start = time.perf_counter()
+            if part.error is None:
+                try:
+                    work(part)
+                except Exception as e:
+                    part.error = str(e)
+                    with self._lock:
+                        self.counters["errors"] += 1
+            self._account(stage, time.perf_counter() - start)
+            self._hand_off(index, part)
+
+    def _capture(self):
+        seq = 0
+        while self._running:
+            start = time.perf_counter()
+            try:
+                captured = self.source()
+            except Exception:
+                self._account("capture", time.perf_counter() - start)
+                with self._lock:
+                    self.counters["errors"] += 1
+                time.sleep(0.01)
+                continue
+            if captured is None:
+                self._account("capture", time.perf_counter() - start)
+                continue
+            capture_ts, frame = captured
+            seq += 1
+            with self._lock:
+                self.counters["captured"] += 1
+            self._account("capture", time.perf_counter() - start)
+            self._hand_off(0, Part(seq, capture_ts, frame))
+
+    def _preprocess(self):
+        color = self.settings.cycle_features.get("Color Detection")
+        def work(part):
+            part.ctx = InspectionContext(part.frame)
+            for roi in self.rois:
+                part.ctx.gray(roi)
+                if color:
+                    part.ctx.hsv(roi)
+        self._stage(1, "preprocess", work)
+
+    def _inspect(self):
+        def work(part):
+            if self.executor is not None:
+                part.results = [f.result() for f in submit_cycle(self.executor, part.ctx, self.rois, self.settings, self.metrics)]
+            else:
+                part.results = [INSPECTIONS[feature](part.ctx, roi, self.settings)
+                                for roi, feature in cycle_jobs(self.rois, self.settings.cycle_features)]
+        self._stage(2, "inspect", work)
+
+    def _judge(self):
+        while self._running:
+            part = self.queues[2].get()
+            if part is None:
+                continue
+            start = time.perf_counter()
+            part.verdict = overall_verdict(part.results) if part.error is None else "NG"
+            part.ctx = None  # drop the cached ROI images; on_part still gets the frame, e.g. to archive it
+            part.done_ts = time.monotonic()
+            with self._lock:
+                self.counters["completed"] += 1
+                self._completions.append(part.done_ts)
+            try:
+                self.on_part(part)
+            except Exception as e:
+                # A failing consumer must not stop the judge, or parts pile up behind it
+                with self._lock:
+                    self.counters["errors"] += 1
+                    self.last_error = f"{type(e).__name__}: {e}"
+            self._account("judge", time.perf_counter() - start)
+
+    def stats(self):
+        """Throughput figures; occupancy is each stage's busy fraction since the previous call.
+
+        The stage with occupancy near 1 is the one limiting parts per minute.
+        """
+        now = time.monotonic()
+        with self._lock:
+            busy = dict(self._busy)
+            counters = dict(self.counters)
+            last_error = self.last_error
+            window_start = max(self._started or now, now - 60.0)
+            recent = sum(1 for ts in self._completions if ts >= window_start)
+            last_time, last_busy = self._last_sample or (now, busy)
+            self._last_sample = (now, busy)
+        elapsed = now - last_time
+        occupancy = {stage: min(1.0, (busy[stage] - last_busy[stage]) / elapsed) if elapsed > 0 else 0.0 for stage in STAGES}
+        window = now - window_start
+        return dict(counters, last_error=last_error, ppm=recent / window * 60 if window > 0 else 0.0, occupancy=occupancy,
+                    queue_depth={stage: len(q) for stage, q in zip(STAGES[1:], self.queues)})
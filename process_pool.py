@@ -0,0 +1,239 @@
+"""Cycle jobs on worker processes, with frames handed over through shared memory."""
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from inspection_engine import INSPECTIONS, InspectionContext, cycle_jobs, freeze_settings
+
+class SharedFrameRing:
+    """Fixed-size frame slots in one shared memory block, written by the parent process.
+
+    write() copies a frame into a free slot and returns the descriptor workers need to
+    view it in place. A slot is handed out again only after release(), so a worker's
+    view never changes under it. A frame larger than the slots replaces the block once
+    every slot is free.
+    """
+
+    def __init__(self, slots=4):
+        self.slots = slots
+        self.slot_bytes = 0
+        self.shm = None
+        self._free = list(range(slots))
+        self._cond = threading.Condition()
+
+    def _allocate(self, nbytes):
+        # Called with every slot free
+        self._unlink()
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes * self.slots)
+        self.slot_bytes = nbytes
+
+    def write(self, frame, timeout=5.0):
+        """Copy frame into a free slot; returns (block name, offset, shape, dtype, slot)."""
+        frame = np.ascontiguousarray(frame)
+        with self._cond:
+            if frame.nbytes > self.slot_bytes:
+                if not self._cond.wait_for(lambda: len(self._free) == self.slots, timeout):
+                    raise TimeoutError("Shared frame slots still in use")
+                self._allocate(frame.nbytes)
+            if not self._cond.wait_for(lambda: self._free, timeout):
+                raise TimeoutError("No free shared frame slot")
+            slot = self._free.pop(0)
+        offset = slot * self.slot_bytes
+        view = np.ndarray(frame.shape, frame.dtype, buffer=self.shm.buf, offset=offset)
+        np.copyto(view, frame)
+        return self.shm.name, offset, frame.shape, frame.dtype.str, slot
+
+    def release(self, slot):
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify_all()
+
+    def _unlink(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        with self._cond:
+            self._unlink()
+
+def _worker_main(inbox, results):
+    """Worker loop: ("recipe", freeze_settings args, rois) replaces the recipe, ("frame", descriptor, jobs)
+    runs jobs [(job_id, roi_index, feature)] on one frame, None stops the worker."""
+    cv2.setNumThreads(1)  # one process per core already, avoid oversubscription
+    settings, rois = None, []
+    blocks = {}
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        if message[0] == "recipe":
+            _, settings_args, rois = message
+            settings = freeze_settings(*settings_args)
+            continue
+        _, (name, offset, shape, dtype, _), jobs = message
+        if name not in blocks:
+            for block in blocks.values():
+                block.close()
+            blocks = {name: shared_memory.SharedMemory(name=name)}
+        ctx = InspectionContext(np.ndarray(shape, np.dtype(dtype), buffer=blocks[name].buf, offset=offset))
+        for job_id, roi_index, feature in jobs:
+            start = time.perf_counter()
+            try:
+                res = INSPECTIONS[feature](ctx, rois[roi_index], settings)
+                res["artifacts"] = {}  # previews are only drawn by the HMI's single inspections
+                results.put((job_id, res, None, time.perf_counter() - start))
+            except Exception as e:
+                results.put((job_id, None, f"{type(e).__name__}: {e}", time.perf_counter() - start))
+        del ctx
+    for block in blocks.values():
+        block.close()
+
+class ProcessInspectionPool:
+    """Runs cycle jobs on worker processes instead of threads, so pure-Python parts of
+    the inspections (blob filtering, result assembly) do not contend for one GIL.
+
+    Each frame is copied once into a SharedFrameRing; workers only receive the slot
+    descriptor and (roi index, feature) pairs. Settings and ROIs are sent to every
+    worker when they change, not per job. Results come back on one queue and resolve
+    the futures returned by submit_cycle(), which has the same contract as
+    inspection_engine.submit_cycle(). Result artifacts are not sent back. If a
+    worker process dies, its pending futures fail with RuntimeError and it gets no
+    more jobs.
+    """
+
+    def __init__(self, workers, slots=4, start_method="spawn", poll_interval=0.5):
+        context = mp.get_context(start_method)  # spawn: never fork the Tk process and its threads
+        self.ring = SharedFrameRing(slots)
+        self.results = context.Queue()
+        self.inboxes = [context.Queue() for _ in range(workers)]
+        self.processes = [context.Process(target=_worker_main, args=(inbox, self.results), name=f"inspection-{i}", daemon=True)
+                          for i, inbox in enumerate(self.inboxes)]
+        for process in self.processes:
+            process.start()
+        self._recipe = None
+        self.poll_interval = poll_interval  # how often the collector checks for dead workers
+        self._closing = False
+        self._lock = threading.Lock()
+        self._pending = {}  # job_id -> (future, worker index, slot, feature, metrics)
+        self._slot_jobs = {}  # slot -> jobs still reading it
+        self._outstanding = [0] * workers
+        self._next_job = 0
+        self._collector = threading.Thread(target=self._collect, name="ProcessInspectionPool", daemon=True)
+        self._collector.start()
+
+    def submit_cycle(self, ctx, rois, settings, metrics=None):
+        """Queue every ROI x feature job of ctx.frame; futures come back in ROI then feature order."""
+        index = {id(roi): i for i, roi in enumerate(rois)}
+        jobs = [(index[id(roi)], feature) for roi, feature in cycle_jobs(rois, settings.cycle_features)]
+        if not jobs:
+            return []
+        alive = [i for i, process in enumerate(self.processes) if process.exitcode is None]
+        if not alive:
+            raise RuntimeError("All inspection worker processes have exited")
+        recipe = (settings, list(rois))
+        if recipe != self._recipe:
+            # Settings hold read-only mapping proxies, which do not pickle; workers refreeze them
+            settings_args = (dict(settings.params), dict(settings.judgment_criteria), dict(settings.blob_outputs),
+                             dict(settings.cycle_features), settings.template)
+            for inbox in self.inboxes:
+                inbox.put(("recipe", settings_args, recipe[1]))
+            self._recipe = recipe
+        descriptor = self.ring.write(ctx.frame)
+        slot = descriptor[4]
+        # All features of an ROI go to one worker so they share its preprocessing, unless
+        # there are fewer ROIs than workers
+        by_roi = len({roi_index for roi_index, _ in jobs}) >= len(alive)
+        groups = {}
+        for roi_index, feature in jobs:
+            groups.setdefault(roi_index if by_roi else len(groups), []).append((roi_index, feature))
+        futures = []
+        batches = {}
+        with self._lock:
+            self._slot_jobs[slot] = len(jobs)
+            for group in groups.values():
+                worker = min(alive, key=self._outstanding.__getitem__)
+                for roi_index, feature in group:
+                    job_id = self._next_job
+                    self._next_job += 1
+                    future = Future()
+                    self._pending[job_id] = (future, worker, slot, feature, metrics)
+                    self._outstanding[worker] += 1
+                    batches.setdefault(worker, []).append((job_id, roi_index, feature))
+                    futures.append(future)
+        for worker, batch in batches.items():
+            self.inboxes[worker].put(("frame", descriptor, batch))
+        return futures
+
+    def _finish(self, job_id):
+        # Called with the lock held; returns the job's pending entry, or None if it was already failed
+        entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return None
+        _, worker, slot, _, _ = entry
+        self._outstanding[worker] -= 1
+        self._slot_jobs[slot] -= 1
+        if self._slot_jobs[slot] == 0:
+            del self._slot_jobs[slot]
+            self.ring.release(slot)
+        return entry
+
+    def _reap(self):
+        # Fail the jobs of workers that died (OOM kill, native crash) so no future waits forever
+        dead = {i: process.exitcode for i, process in enumerate(self.processes) if process.exitcode is not None}
+        if not dead or self._closing:
+            return
+        with self._lock:
+            lost = [(self._finish(job_id), dead[entry[1]]) for job_id, entry in list(self._pending.items()) if entry[1] in dead]
+        for (future, worker, *_), exitcode in lost:
+            future.set_exception(RuntimeError(f"Inspection worker {worker} exited with code {exitcode}"))
+
+    def _collect(self):
+        next_reap = time.monotonic() + self.poll_interval
+        while True:
+            try:
+                message = self.results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                message = ()
+            if message is None:
+                break
+            if time.monotonic() >= next_reap:
+                self._reap()
+                next_reap = time.monotonic() + self.poll_interval
+            if not message:
+                continue
+            job_id, res, error, seconds = message
+            with self._lock:
+                entry = self._finish(job_id)
+            if entry is None:
+                continue
+            future, _, _, feature, metrics = entry
+            if metrics:
+                metrics.observe(feature, seconds)
+            if error is None:
+                future.set_result(res)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def shutdown(self, wait=True):
+        self._closing = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        if wait:
+            for process in self.processes:
+                process.join(5.0)
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        self.results.put(None)
+        self._collector.join(1.0)
+        with self._lock:
+            for future, *_ in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self.ring.close()
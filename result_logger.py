@@ -0,0 +1,151 @@
+"""Queue-backed result logger so inspections never wait on the SD card."""
+import csv
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from inspection_history import InspectionHistory
+
+class ResultLogger:
+    """Buffers records on a queue and writes them from a writer thread in batches.
+
+    A record is (ts, cycle_id, roi_id, inspection_type, result, value, details) with ts
+    in epoch seconds. A batch is written once flush_records records are pending or
+    flush_interval seconds have passed, to the CSV at path (if given) and to the
+    SQLite history at history_path (if given). The CSV is rotated when it exceeds
+    max_bytes or the day changes; rotated files keep the base name plus a timestamp suffix.
+    """
+
+    def __init__(self, path, header, history_path=None, flush_records=200, flush_interval=1.0,
+                 max_bytes=10 * 1024 * 1024, rotate_daily=True, max_queue=10000):
+        self.path = path
+        self.header = header
+        self.history_path = history_path
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.counters = {"logged": 0, "written": 0, "dropped": 0, "rotations": 0, "errors": 0}
+        self.last_error = None
+        self._lock = threading.Lock()  # log() runs on the UI, cycle and pipeline threads, the writer on its own
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = object()
+        self._file = None
+        self._writer = None
+        self._file_date = None
+        self._history = None
+        self._thread = threading.Thread(target=self._run, name="ResultLogger", daemon=True)
+        self._thread.start()
+
+    def log(self, record):
+        """Queue one record; never blocks. Records are dropped (and counted) if the queue is full."""
+        try:
+            self._queue.put_nowait(record)
+            self._count("logged")
+        except queue.Full:
+            self._count("dropped")
+
+    def _count(self, name, n=1, error=None):
+        with self._lock:
+            self.counters[name] += n
+            if error is not None:
+                self.last_error = error
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, queue_depth=self.queue_depth())
+
+    def close(self, timeout=5.0):
+        """Write everything still queued and close the file."""
+        if self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join(timeout)
+
+    def _run(self):
+        if self.history_path:
+            try:
+                self._history = InspectionHistory(self.history_path)  # sqlite connections belong to one thread
+            except Exception as e:
+                self._count("errors", error=e)
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is self._stop:
+                self._write(batch)
+                self._close_file()
+                if self._history:
+                    self._history.close()
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.flush_records or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        if not batch:
+            return
+        written = True  # only counted once every sink has the batch
+        if self._history:
+            try:
+                self._history.insert_many(batch)
+            except Exception as e:
+                written = False
+                self._count("errors", error=e)
+        if self.path:
+            try:
+                self._rotate_if_needed()
+                if self._file is None:
+                    self._open_file()
+                self._writer.writerows([datetime.fromtimestamp(r[0]).strftime("%Y-%m-%d %H:%M:%S"), r[2], r[3], r[4], r[6]]
+                                       for r in batch)
+                self._file.flush()
+            except Exception as e:
+                written = False
+                self._count("errors", error=e)
+                self._close_file()
+        if written:
+            self._count("written", len(batch))
+
+    def _open_file(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "a", newline="")
+        self._writer = csv.writer(self._file)
+        self._file_date = datetime.fromtimestamp(os.path.getmtime(self.path)).date() if not new_file else datetime.now().date()
+        if new_file:
+            self._writer.writerow(self.header)
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+                self._writer = None
+
+    def _rotate_if_needed(self):
+        if not os.path.exists(self.path):
+            return
+        if self._file is None:
+            self._open_file()
+        too_big = self.max_bytes and os.path.getsize(self.path) >= self.max_bytes
+        new_day = self.rotate_daily and self._file_date != datetime.now().date()
+        if too_big or new_day:
+            self._close_file()
+            base, ext = os.path.splitext(self.path)
+            rotated = f"{base}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+            suffix = 1
+            while os.path.exists(rotated):
+                rotated = f"{base}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{suffix}{ext}"
+                suffix += 1
+            os.replace(self.path, rotated)
+            self._count("rotations")
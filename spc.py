@@ -0,0 +1,111 @@
+"""Rolling statistical process control figures per ROI x inspection, updated as results arrive."""
+import math
+from collections import deque
+import numpy as np
+
+class SpcSeries:
+    """The last size values of one ROI x inspection in fixed numpy rings, with window statistics.
+
+    Every add() is O(1): mean and variance are updated with a sliding Welford step,
+    min and max come from monotonic deques, and the OK count is adjusted for the
+    value that drops out of the window. Cp and Cpk use the spec band of the newest result.
+    """
+
+    __slots__ = ("size", "values", "passed", "seq", "count", "mean", "m2", "ok", "lower", "upper", "_mins", "_maxs")
+
+    def __init__(self, size=500):
+        self.size = size
+        self.values = np.zeros(size, dtype=np.float64)
+        self.passed = np.zeros(size, dtype=bool)
+        self.seq = 0  # results ever added; the newest is at (seq - 1) % size
+        self.count = 0  # results in the window
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean over the window
+        self.ok = 0
+        self.lower = None
+        self.upper = None
+        self._mins = deque()  # seq numbers of window minima candidates, values increasing
+        self._maxs = deque()
+
+    def add(self, value, ok, limits=None):
+        slot = self.seq % self.size
+        if self.count == self.size:
+            old = float(self.values[slot])
+            self.ok -= bool(self.passed[slot])
+            old_mean = self.mean
+            self.mean += (value - old) / self.count
+            self.m2 = max(0.0, self.m2 + (value - old) * (value - self.mean + old - old_mean))
+        else:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        self.values[slot] = value
+        self.passed[slot] = ok
+        self.ok += bool(ok)
+        oldest = self.seq - self.count + 1
+        for window, worse in ((self._mins, lambda v: v >= value), (self._maxs, lambda v: v <= value)):
+            while window and window[0] < oldest:
+                window.popleft()
+            while window and worse(self.values[window[-1] % self.size]):
+                window.pop()
+            window.append(self.seq)
+        self.seq += 1
+        if limits is not None:
+            self.lower, self.upper = limits
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def minimum(self):
+        return float(self.values[self._mins[0] % self.size]) if self._mins else None
+
+    @property
+    def maximum(self):
+        return float(self.values[self._maxs[0] % self.size]) if self._maxs else None
+
+    @property
+    def yield_pct(self):
+        return self.ok / self.count * 100 if self.count else None
+
+    def capability(self):
+        """(Cp, Cpk) against the spec band; None where a side is open or the spread is zero."""
+        std = self.std
+        if self.count < 2 or std == 0:
+            return None, None
+        cp = (self.upper - self.lower) / (6 * std) if self.lower is not None and self.upper is not None else None
+        sides = []
+        if self.upper is not None:
+            sides.append((self.upper - self.mean) / (3 * std))
+        if self.lower is not None:
+            sides.append((self.mean - self.lower) / (3 * std))
+        return cp, (min(sides) if sides else None)
+
+    def summary(self):
+        cp, cpk = self.capability()
+        return {"count": self.count, "mean": self.mean, "std": self.std, "min": self.minimum, "max": self.maximum,
+                "yield": self.yield_pct, "lower": self.lower, "upper": self.upper, "cp": cp, "cpk": cpk}
+
+class SpcTracker:
+    """One SpcSeries per (roi_id, inspection_type), fed with inspection result dicts."""
+
+    def __init__(self, window=500):
+        self.window = window
+        self.series = {}
+
+    def add(self, res):
+        key = (res["roi_id"], res["inspection_type"])
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = SpcSeries(self.window)
+        series.add(res["value"], res["result"] == "OK", res.get("limits"))
+
+    def reset(self):
+        self.series.clear()
+
+    def summaries(self):
+        """[(roi_id, inspection_type, summary dict)] sorted by ROI then inspection."""
+        return [(roi_id, inspection_type, series.summary())
+                for (roi_id, inspection_type), series in sorted(self.series.items())]
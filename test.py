@@ -1,17 +1,28 @@
+import time
+LAUNCH_TIME = time.perf_counter()  # before the heavy imports, so startup_times.log includes them
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import cv2
 import numpy as np
 from PIL import Image, ImageTk
-import csv
 from datetime import datetime
 import os
 import json
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+import queue
 import threading
-import time
-# import RPi.GPIO as GPIO  # Uncomment for real Raspberry Pi
+from concurrent.futures import ThreadPoolExecutor
+from camera_capture import FrameGrabber
+from result_logger import ResultLogger
+from inspection_history import InspectionHistory
+from trigger_input import GPIO, GpioTrigger, FifoTrigger, LatencyLog
+from metrics import Metrics
+from process_pool import ProcessInspectionPool
+from spc import SpcTracker
+from pipeline import BACKPRESSURE_POLICIES, STAGES, InspectionPipeline
+from image_archiver import ImageArchiver
+from inspection_engine import (InspectionContext, TemplateModel, inspect_blobs, inspect_density, inspect_contrast, inspect_edge,
+                               inspect_template, inspect_contours, inspect_color, inspect_measurement, inspect_focus, submit_cycle, overall_verdict,
+                               freeze_settings, encode_image, decode_image, RoiMask, roi_to_json, roi_from_json, SCALE_PARAMS)
 
 class VisionHMI:
     def __init__(self, root):
@@ -24,10 +35,28 @@ class VisionHMI:
         self.root.attributes("-fullscreen", True)  # Optionnel
         self.root.bind("<Escape>", lambda e: self.root.attributes("-fullscreen", False))
 
-        # Initialize camera
+        # Per-stage timings (capture, inspections, logging, redraw), exported for a local scraper
+        self.metrics = Metrics()
+        self.metrics_enabled = tk.BooleanVar(value=True)
+        self.metrics_file = "visionmaster_metrics.prom"
+        self.metrics_interval_ms = 5000
+        self.metrics_error = None  # last export error, toasted once until an export succeeds again
+        self.perf_status = None
+
+        # Startup timing (ms since launch per stage), appended to startup_times.log once the window is up
+        self.startup_log = "startup_times.log"
+        self.startup_marks = {}
+        self.mark_startup("import")
+
+        # Camera is opened in the background; the window comes up on the static path meanwhile
         self.cap = None
-        self.use_static_image = False
+        self.grabber = None
+        self.use_static_image = True
         self.static_image = None
+        self.static_image_ts = None  # monotonic time static_image was set; continuous mode takes one part per image
+        self.static_image_cond = threading.Condition()
+        self.camera_state = "opening"
+        self.camera_timeout_ms = 5000
         self.init_camera()
 
         # Modes
@@ -36,6 +65,7 @@ class VisionHMI:
 
         # ROI management
         self.rois = []  # (x, y, w, h, id, angle, shape, mask)
+        self.roi_version = 0  # bumped on every ROI change so cached ROI data can be rebuilt
         self.selected_roi = None
         self.drawing = False
         self.resizing = False
@@ -48,6 +78,18 @@ class VisionHMI:
         self.snap_to_grid = tk.BooleanVar(value=False)
         self.roi_shape = tk.StringVar(value="rectangle")
 
+        # Live view
+        self.display_fps = tk.DoubleVar(value=15.0)
+        self.photo = None
+        self.video_item = None
+        self.roi_overlay = []
+        self.roi_overlay_key = None
+        self.listed_roi_ids = None
+        self.led_state = None
+        self.roi_id_menu = None  # widgets of the deferred inspection and settings tabs, see setup_gui
+        self.template_label = None
+        self.gpio_label = None
+
         # Inspection parameters with min/max
         self.params = {
             "density_threshold_min": tk.DoubleVar(value=90.0),
@@ -119,6 +161,9 @@ class VisionHMI:
             "color_brightness_min": tk.DoubleVar(value=0.0),
             "color_brightness_max": tk.DoubleVar(value=255.0)
         }
+        # Processing scale per feature (pyramid level: 0 = full, 1 = 1/2, 2 = 1/4 resolution)
+        for key in SCALE_PARAMS.values():
+            self.params[key] = tk.IntVar(value=0)
 
         # Blob Output Parameters
         self.blob_outputs = {
@@ -142,6 +187,7 @@ class VisionHMI:
         }
 
         self.template_image = None
+        self.template_model = None  # pyramid built once per template, see set_template
         self.temp_selected_pin = tk.IntVar(value=-1)
         self.color_picking = False
         self.test_images = []
@@ -150,6 +196,12 @@ class VisionHMI:
         # Cycle logic
         self.cycle_state = "Idle"
         self.cycle_results = {}
+        self.spc = SpcTracker(window=500)  # rolling per ROI x inspection statistics of cycle results
+        self.cycle_workers = tk.IntVar(value=os.cpu_count() or 1)
+        self.cycle_execution = tk.StringVar(value="Threads")  # "Processes": ProcessInspectionPool with shared-memory frames
+        self.cycle_executor = None
+        self.cycle_executor_workers = 0
+        self.cycle_executor_mode = None
         self.cycle_features = {
             "Density": tk.BooleanVar(value=True),
             "Contrast": tk.BooleanVar(value=False),
@@ -162,36 +214,136 @@ class VisionHMI:
             "Focus Check": tk.BooleanVar(value=False)
         }
 
-        # GPIO simulation
-        self.gpio_trigger_active = False
-        self.gpio_thread = None
+        # Frozen snapshot of params, blob outputs, judgment criteria and cycle features, dropped whenever one of them is written
+        self.settings = None
+        for var in (list(self.params.values()) + list(self.blob_outputs.values()) +
+                    list(self.judgment_criteria.values()) + list(self.cycle_features.values())):
+            var.trace_add("write", self.invalidate_settings)
+
+        # Cycle trigger: GPIO edge on a Pi, otherwise a FIFO anyone can write to
+        self.trigger = None
+        self.trigger_config = None  # (pin, debounce_ms) the running trigger was started with
+        self.trigger_fifo = "/tmp/visionmaster_trigger"
+        self.trigger_debounce_ms = tk.IntVar(value=20)
+        self.missed_triggers = 0
+        self.latency_log = LatencyLog()
+        self.last_frame_ts = None
 
         # Logging
         self.log_file = "inspection_log.csv"
+        self.history_file = "inspection_history.db"
+        self.log_page_size = 100
+        self.logger = None
+        self.log_error_shown = None  # last ResultLogger error already toasted
+        self.history = None
+        self.cycle_id = 0
+        self.active_cycle_id = None
         self.init_log()
 
+        # Image archive: NG frames (and every Nth OK one) saved with ROI outlines by a writer thread
+        self.archive_dir = "archive"
+        self.archive_enabled = tk.BooleanVar(value=True)
+        self.archive_format = tk.StringVar(value="PNG")
+        self.archive_png_level = tk.IntVar(value=3)
+        self.archive_jpeg_quality = tk.IntVar(value=90)
+        self.archive_ok_every = tk.IntVar(value=0)
+        self.archive_quota_mb = tk.IntVar(value=500)
+        self.archiver = ImageArchiver(self.archive_dir)
+
+        # Cycles run on a worker thread and post ("progress", ...) / ("done", ...) here for the Tk thread
+        self.cycle_queue = queue.Queue()
+        self.cycle_poll_ms = 20
+        self.cycle_on_done = None
+
+        # Continuous (pipelined) inspection; parts are posted to cycle_queue as ("part", part)
+        self.pipeline = None
+        self.pipeline_policy = tk.StringVar(value="drop oldest")
+        self.pipeline_queue_size = tk.IntVar(value=2)
+        self.pipeline_status_job = None
+
         # Setup GUI
         self.setup_gui()
         self.load_settings()
+        self.mark_startup("gui")
+        self.root.after_idle(lambda: self.mark_startup("window"))
 
         # Start video feed
         self.update_video()
 
-        # Start GPIO simulation (if pin set)
-        self.start_gpio_simulation()
+        # Start listening for cycle triggers (no-op if load_settings already did)
+        self.start_trigger()
+
+        # Periodic metrics export
+        self.update_metrics()
+
+        # Cycle progress and results
+        self.drain_cycle_queue()
 
     def init_camera(self):
+        # VideoCapture(0) can block for seconds; open it on a thread and poll for the outcome from Tk
+        opened = {}
+        def open_camera():
+            try:
+                opened["cap"] = cv2.VideoCapture(0)
+            except Exception as e:
+                opened["error"] = e
+        threading.Thread(target=open_camera, name="camera-open", daemon=True).start()
+        deadline = time.monotonic() + self.camera_timeout_ms / 1000
+        def poll():
+            if self.camera_state != "opening":
+                return
+            cap = opened.get("cap")
+            if cap is not None and cap.isOpened():
+                self.cap = cap
+                self.grabber = FrameGrabber(self.cap, metrics=self.metrics)
+                self.grabber.start()
+                self.camera_state = "camera"
+                if self.static_image is None:  # not showing a test image
+                    self.use_static_image = False
+                self.mark_startup("camera")
+            elif "cap" in opened or "error" in opened or time.monotonic() >= deadline:
+                self.camera_state = "static"
+                if cap is not None:
+                    cap.release()
+                else:
+                    threading.Thread(target=release_late, daemon=True).start()
+                self.use_static_image_fallback()
+            else:
+                self.root.after(50, poll)
+        def release_late():
+            # The open timed out; a camera that still shows up is released, the fallback stays
+            while "cap" not in opened and "error" not in opened:
+                time.sleep(0.5)
+            if opened.get("cap") is not None:
+                opened["cap"].release()
+        self.root.after(50, poll)
+
+    def use_static_image_fallback(self):
+        if self.static_image is None:
+            self.set_static_image(cv2.imread("sample_image.jpg"))
+        self.mark_startup("camera")
+        if self.static_image is None:
+            messagebox.showerror("Error", "No sample image found.")
+            self.root.quit()
+            return
+        self.show_toast("Camera unavailable. Using static image.")
+
+    def mark_startup(self, stage):
+        """Record ms since launch for stage; the line is logged once the window and the camera outcome are both in."""
+        if stage in self.startup_marks:
+            return
+        self.startup_marks[stage] = (time.perf_counter() - LAUNCH_TIME) * 1000
+        if "window" not in self.startup_marks or "camera" not in self.startup_marks:
+            return
+        total_ms = max(self.startup_marks.values())
+        self.metrics.observe("startup", total_ms / 1000)
+        stages = " ".join(f"{name}={ms:.0f}ms" for name, ms in self.startup_marks.items())
+        line = f"{datetime.now():%Y-%m-%d %H:%M:%S} ready={total_ms:.0f}ms {stages} source={self.camera_state}"
         try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                raise Exception("Camera unavailable")
-        except Exception:
-            messagebox.showinfo("Info", "Camera unavailable. Using static image.")
-            self.use_static_image = True
-            self.static_image = cv2.imread("sample_image.jpg")
-            if self.static_image is None:
-                messagebox.showerror("Error", "No sample image found.")
-                self.root.quit()
+            with open(self.startup_log, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            self.show_toast(f"Startup log error: {e}")
 
     def setup_gui(self):
         style = ttk.Style()
@@ -368,6 +520,72 @@ class VisionHMI:
         # Inspection Tab
         self.inspection_frame = ttk.Frame(self.notebook, padding=2)
         self.notebook.add(self.inspection_frame, text="Inspections")
+        # Cycle Logic Tab
+        self.cycle_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.cycle_frame, text=" Cycle Logic")
+        ttk.Label(self.cycle_frame, text="Cycle Features").pack(pady=5)
+        cycle_inner = ttk.Frame(self.cycle_frame)
+        cycle_inner.pack(fill=tk.BOTH, padx=5)
+        for feature, var in self.cycle_features.items():
+            feature_row = ttk.Frame(cycle_inner)
+            feature_row.pack(fill=tk.X)
+            ttk.Checkbutton(feature_row, text=feature, variable=var).pack(side=tk.LEFT)
+            if feature in SCALE_PARAMS:
+                # 0 = full resolution, 1 = half, 2 = quarter; thresholds stay in full-resolution units
+                ttk.Combobox(feature_row, textvariable=self.params[SCALE_PARAMS[feature]], values=[0, 1, 2], state="readonly", width=2).pack(side=tk.RIGHT)
+                ttk.Label(feature_row, text="Scale", font=("DejaVu Sans", 7)).pack(side=tk.RIGHT, padx=2)
+        ttk.Button(self.cycle_frame, text=" Save Config", command=self.save_cycle_config).pack(pady=5)
+        ttk.Button(self.cycle_frame, text=" Load Config", command=self.load_cycle_config).pack(pady=5)
+        self.cycle_run_button = ttk.Button(self.cycle_frame, text=" Run Cycle", command=self.run_cycle_logic)
+        self.cycle_run_button.pack(pady=5)
+        self.cycle_label = ttk.Label(self.cycle_frame, text="Cycle State: Idle")
+        self.cycle_label.pack(pady=5)
+        self.progress = ttk.Progressbar(self.cycle_frame, length=200, mode="determinate")
+        self.progress.pack(pady=5)
+        continuous_frame = ttk.Frame(self.cycle_frame)
+        continuous_frame.pack(fill=tk.X, padx=5)
+        self.continuous_button = ttk.Button(continuous_frame, text=" Start Continuous", command=self.toggle_continuous)
+        self.continuous_button.pack(side=tk.LEFT)
+        ttk.Label(continuous_frame, text="When full:", font=("DejaVu Sans", 7)).pack(side=tk.LEFT, padx=2)
+        ttk.Combobox(continuous_frame, textvariable=self.pipeline_policy, values=list(BACKPRESSURE_POLICIES), state="readonly", width=11).pack(side=tk.LEFT)
+        ttk.Label(continuous_frame, text="Queue:", font=("DejaVu Sans", 7)).pack(side=tk.LEFT, padx=2)
+        ttk.Entry(continuous_frame, textvariable=self.pipeline_queue_size, width=3).pack(side=tk.LEFT)
+        self.pipeline_label = ttk.Label(self.cycle_frame, text="Continuous: stopped", font=("DejaVu Sans", 7))
+        self.pipeline_label.pack(fill=tk.X, padx=5)
+        spc_header = ttk.Frame(self.cycle_frame)
+        spc_header.pack(fill=tk.X, padx=5)
+        ttk.Label(spc_header, text=f"SPC (last {self.spc.window} cycles)").pack(side=tk.LEFT)
+        ttk.Button(spc_header, text="Reset", command=self.reset_spc, width=6).pack(side=tk.RIGHT)
+        spc_columns = ("ROI", "Inspection", "N", "Mean", "Std", "Min", "Max", "Yield", "Cp", "Cpk")
+        self.spc_tree = ttk.Treeview(self.cycle_frame, columns=spc_columns, show="headings", height=6)
+        for col in spc_columns:
+            self.spc_tree.heading(col, text=col)
+            self.spc_tree.column(col, width=90 if col == "Inspection" else 45, anchor=tk.W if col == "Inspection" else tk.E)
+        self.spc_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Simulation Tab
+        self.simulation_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.simulation_frame, text=" Simulation")
+        ttk.Button(self.simulation_frame, text=" Load Test Images", command=self.load_test_images).pack(pady=5)
+        ttk.Button(self.simulation_frame, text=" Next Image", command=self.next_test_image).pack(pady=5)
+        ttk.Button(self.simulation_frame, text=" Run Test Cycle", command=self.run_test_cycle).pack(pady=5)
+        self.test_image_label = ttk.Label(self.simulation_frame, text="No test images loaded")
+        self.test_image_label.pack(pady=5)
+
+        # Settings Tab
+        self.settings_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.settings_frame, text=" Settings")
+
+        # The inspection and settings tabs hold most of the widgets; they are built the first time they are shown
+        self.deferred_tabs = {str(self.inspection_frame): self.build_inspection_tab, str(self.settings_frame): self.build_settings_tab}
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def on_tab_changed(self, event=None):
+        build = self.deferred_tabs.pop(str(self.notebook.select()), None)
+        if build is not None:
+            build()
+
+    def build_inspection_tab(self):
         ttk.Label(self.inspection_frame, text="ROI ID", font=("DejaVu Sans", 8)).pack(pady=2)
         self.roi_id_var = tk.StringVar()
         self.roi_id_menu = tk.OptionMenu(self.inspection_frame, self.roi_id_var, "")
@@ -440,6 +658,39 @@ class VisionHMI:
         ttk.Entry(edge_subframe, textvariable=self.params["edge_canny_low"], width=4).grid(row=0, column=1, padx=2, pady=1)
         ttk.Label(edge_subframe, text="Canny High:", font=("DejaVu Sans", 7)).grid(row=0, column=2, padx=2, pady=1, sticky="e")
         ttk.Entry(edge_subframe, textvariable=self.params["edge_canny_high"], width=4).grid(row=0, column=3, padx=2, pady=1)
+        # Template Matching
+        template_frame = create_collapsible_section(inspection_inner, "Template Matching")
+        ttk.Label(template_frame, text="Min:", font=("DejaVu Sans", 7)).grid(row=0, column=0, padx=2, pady=1, sticky="e")
+        ttk.Entry(template_frame, textvariable=self.params["template_threshold_min"], width=4).grid(row=0, column=1, padx=2, pady=1)
+        ttk.Scale(template_frame, from_=0, to=1, orient=tk.HORIZONTAL, variable=self.params["template_threshold_min"], length=40).grid(row=0, column=2, padx=2, pady=1)
+        ttk.Label(template_frame, text="Max:", font=("DejaVu Sans", 7)).grid(row=1, column=0, padx=2, pady=1, sticky="e")
+        ttk.Entry(template_frame, textvariable=self.params["template_threshold_max"], width=4).grid(row=1, column=1, padx=2, pady=1)
+        ttk.Scale(template_frame, from_=0, to=1, orient=tk.HORIZONTAL, variable=self.params["template_threshold_max"], length=40).grid(row=1, column=2, padx=2, pady=1)
+        ttk.Button(template_frame, text="Run", command=self.run_template_matching, width=6).grid(row=0, column=3, padx=2, pady=1)
+        ttk.Button(template_frame, text="Preview", command=lambda: self.run_template_matching(preview=True), width=6).grid(row=1, column=3, padx=2, pady=1)
+        template_subframe = ttk.Frame(template_frame)
+        template_subframe.grid(row=2, column=0, columnspan=4, sticky="ew", padx=5, pady=1)
+        ttk.Button(template_subframe, text="From ROI", command=self.capture_template, width=8).grid(row=0, column=0, padx=2, pady=1)
+        ttk.Button(template_subframe, text="Load", command=self.load_template, width=6).grid(row=0, column=1, padx=2, pady=1)
+        self.template_label = ttk.Label(template_subframe, text="No template", font=("DejaVu Sans", 7))
+        self.template_label.grid(row=0, column=2, padx=2, pady=1)
+        # Contour Analysis
+        contour_frame = create_collapsible_section(inspection_inner, "Contour Analysis")
+        for row, (label, key, upper) in enumerate([("Area", "contour_area_threshold", 10000), ("Perim.", "contour_perimeter", 2000),
+                                                   ("Circ.", "contour_circularity", 1)]):
+            ttk.Label(contour_frame, text=f"{label} Min:", font=("DejaVu Sans", 7)).grid(row=row, column=0, padx=2, pady=1, sticky="e")
+            ttk.Entry(contour_frame, textvariable=self.params[f"{key}_min"], width=4).grid(row=row, column=1, padx=2, pady=1)
+            ttk.Label(contour_frame, text="Max:", font=("DejaVu Sans", 7)).grid(row=row, column=2, padx=2, pady=1, sticky="e")
+            ttk.Entry(contour_frame, textvariable=self.params[f"{key}_max"], width=4).grid(row=row, column=3, padx=2, pady=1)
+        ttk.Button(contour_frame, text="Run", command=self.run_contour_analysis, width=6).grid(row=0, column=4, padx=2, pady=1)
+        ttk.Button(contour_frame, text="Preview", command=lambda: self.run_contour_analysis(preview=True), width=6).grid(row=1, column=4, padx=2, pady=1)
+        contour_subframe = ttk.Frame(contour_frame)
+        contour_subframe.grid(row=3, column=0, columnspan=5, sticky="ew", padx=5, pady=1)
+        ttk.Label(contour_subframe, text="Blur:", font=("DejaVu Sans", 7)).grid(row=0, column=0, padx=2, pady=1, sticky="e")
+        ttk.Combobox(contour_subframe, textvariable=self.params["contour_gaussian_blur"], values=[0, 3, 5, 7], state="readonly", width=3).grid(row=0, column=1, padx=2, pady=1)
+        ttk.Label(contour_subframe, text="Morph:", font=("DejaVu Sans", 7)).grid(row=0, column=2, padx=2, pady=1, sticky="e")
+        ttk.Combobox(contour_subframe, textvariable=self.params["contour_morph_kernel"], values=[0, 3, 5, 7], state="readonly", width=3).grid(row=0, column=3, padx=2, pady=1)
+        ttk.Combobox(contour_subframe, textvariable=self.params["contour_hierarchy_mode"], values=["External", "All"], state="readonly", width=8).grid(row=0, column=4, padx=2, pady=1)
         # Blob Detection
         blob_frame = create_collapsible_section(inspection_inner, "Blob Detection")
         # Threshold
@@ -584,36 +835,10 @@ class VisionHMI:
         ttk.Scale(focus_frame, from_=0, to=500, orient=tk.HORIZONTAL, variable=self.params["focus_threshold_max"], length=40).grid(row=1, column=2, padx=2, pady=1)
         ttk.Button(focus_frame, text="Run", command=self.run_focus_check, width=6).grid(row=0, column=3, padx=2, pady=1)
         ttk.Button(focus_frame, text="Preview", command=lambda: self.run_focus_check(preview=True), width=6).grid(row=1, column=3, padx=2, pady=1)
+        self.listed_roi_ids = None  # fill the ROI ID menu on the next refresh
+        self.update_template_label()
 
-        # Cycle Logic Tab
-        self.cycle_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.cycle_frame, text=" Cycle Logic")
-        ttk.Label(self.cycle_frame, text="Cycle Features").pack(pady=5)
-        cycle_inner = ttk.Frame(self.cycle_frame)
-        cycle_inner.pack(fill=tk.BOTH, padx=5)
-        for feature, var in self.cycle_features.items():
-            ttk.Checkbutton(cycle_inner, text=feature, variable=var).pack(anchor=tk.W)
-        ttk.Button(self.cycle_frame, text=" Save Config", command=self.save_cycle_config).pack(pady=5)
-        ttk.Button(self.cycle_frame, text=" Load Config", command=self.load_cycle_config).pack(pady=5)
-        self.cycle_run_button = ttk.Button(self.cycle_frame, text=" Run Cycle", command=self.run_cycle_logic)
-        self.cycle_run_button.pack(pady=5)
-        self.cycle_label = ttk.Label(self.cycle_frame, text="Cycle State: Idle")
-        self.cycle_label.pack(pady=5)
-        self.progress = ttk.Progressbar(self.cycle_frame, length=200, mode="determinate")
-        self.progress.pack(pady=5)
-
-        # Simulation Tab
-        self.simulation_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.simulation_frame, text=" Simulation")
-        ttk.Button(self.simulation_frame, text=" Load Test Images", command=self.load_test_images).pack(pady=5)
-        ttk.Button(self.simulation_frame, text=" Next Image", command=self.next_test_image).pack(pady=5)
-        ttk.Button(self.simulation_frame, text=" Run Test Cycle", command=self.run_test_cycle).pack(pady=5)
-        self.test_image_label = ttk.Label(self.simulation_frame, text="No test images loaded")
-        self.test_image_label.pack(pady=5)
-
-        # Settings Tab
-        self.settings_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.settings_frame, text=" Settings")
+    def build_settings_tab(self):
         settings_canvas = tk.Canvas(self.settings_frame, bg="#e6e6e6")
         settings_scrollbar = ttk.Scrollbar(self.settings_frame, orient=tk.VERTICAL, command=settings_canvas.yview)
         settings_inner = ttk.Frame(settings_canvas)
@@ -626,7 +851,7 @@ class VisionHMI:
         settings_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
         settings_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-        for param_name in sorted(set(k.rsplit("_", 1)[0] for k in self.params.keys() if k != "gpio_trigger_pin")):
+        for param_name in sorted(set(k.rsplit("_", 1)[0] for k in self.params.keys() if k != "gpio_trigger_pin" and not k.endswith("_scale"))):
             frame = ttk.Frame(settings_inner)
             frame.pack(fill=tk.X, pady=3)
             ttk.Label(frame, text=param_name.replace("_", " ").title(), width=20).pack(side=tk.LEFT, padx=5)
@@ -652,14 +877,41 @@ class VisionHMI:
         self.gpio_label = ttk.Label(gpio_frame, text=f"Pin: {self.params['gpio_trigger_pin'].get() if self.params['gpio_trigger_pin'].get() != -1 else 'None'}")
         self.gpio_label.pack(side=tk.LEFT, padx=5)
         ttk.Button(gpio_frame, text=" Setup GPIO", command=self.setup_gpio).pack(side=tk.LEFT, padx=5)
+        debounce_frame = ttk.Frame(settings_inner)
+        debounce_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(debounce_frame, text="Trigger Debounce (ms)", width=20).pack(side=tk.LEFT, padx=5)
+        ttk.Entry(debounce_frame, textvariable=self.trigger_debounce_ms, width=6).pack(side=tk.LEFT, padx=2)
+        display_frame = ttk.Frame(settings_inner)
+        display_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(display_frame, text="Live View FPS", width=20).pack(side=tk.LEFT, padx=5)
+        ttk.Entry(display_frame, textvariable=self.display_fps, width=6).pack(side=tk.LEFT, padx=2)
+        workers_frame = ttk.Frame(settings_inner)
+        workers_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(workers_frame, text="Cycle Workers", width=20).pack(side=tk.LEFT, padx=5)
+        ttk.Entry(workers_frame, textvariable=self.cycle_workers, width=6).pack(side=tk.LEFT, padx=2)
+        ttk.Combobox(workers_frame, textvariable=self.cycle_execution, values=["Threads", "Processes"], state="readonly", width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(settings_inner, text="Record Stage Timings", variable=self.metrics_enabled).pack(anchor=tk.W, padx=5, pady=5)
+        archive_frame = ttk.Frame(settings_inner)
+        archive_frame.pack(fill=tk.X, pady=5)
+        ttk.Checkbutton(archive_frame, text="Archive NG Images", variable=self.archive_enabled).pack(side=tk.LEFT, padx=5)
+        ttk.Combobox(archive_frame, textvariable=self.archive_format, values=["PNG", "JPEG"], state="readonly", width=5).pack(side=tk.LEFT, padx=2)
+        ttk.Label(archive_frame, text="PNG Level", font=("DejaVu Sans", 7)).pack(side=tk.LEFT, padx=2)
+        ttk.Entry(archive_frame, textvariable=self.archive_png_level, width=3).pack(side=tk.LEFT)
+        ttk.Label(archive_frame, text="JPEG Quality", font=("DejaVu Sans", 7)).pack(side=tk.LEFT, padx=2)
+        ttk.Entry(archive_frame, textvariable=self.archive_jpeg_quality, width=4).pack(side=tk.LEFT)
+        archive_limits_frame = ttk.Frame(settings_inner)
+        archive_limits_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(archive_limits_frame, text="Also Every Nth OK (0 = off)", width=24).pack(side=tk.LEFT, padx=5)
+        ttk.Entry(archive_limits_frame, textvariable=self.archive_ok_every, width=5).pack(side=tk.LEFT, padx=2)
+        ttk.Label(archive_limits_frame, text="Quota (MB)", font=("DejaVu Sans", 7)).pack(side=tk.LEFT, padx=2)
+        ttk.Entry(archive_limits_frame, textvariable=self.archive_quota_mb, width=6).pack(side=tk.LEFT)
         ttk.Button(settings_inner, text=" Save Settings", command=self.save_settings).pack(pady=5)
 
     def init_log(self):
         try:
-            if not os.path.exists(self.log_file):
-                with open(self.log_file, "w", newline="") as f:
-                    writer = csv.writer(f)
-                    writer.writerow(["Timestamp", "ROI ID", "Inspection Type", "Result", "Details"])
+            self.logger = ResultLogger(self.log_file, ["Timestamp", "ROI ID", "Inspection Type", "Result", "Details"],
+                                       history_path=self.history_file)
+            self.cycle_id = self.get_history().last_cycle_id()
         except Exception as e:
             self.show_toast(f"Log initialization failed: {e}")
 
@@ -691,15 +943,6 @@ class VisionHMI:
         fade_in()
         toast.after(duration, lambda: fade_out())
 
-    def validate_min_max(self, min_key, max_key):
-        if min_key in self.params and max_key in self.params:
-            min_val = self.params[min_key].get()
-            max_val = self.params[max_key].get()
-            if min_val > max_val:
-                self.show_toast(f"{min_key} must be <= {max_key}")
-                return False
-        return True
-
     def update_mode(self, *args):
         mode = self.mode.get()
         self.status_var.set(f"Prêt | {mode}")
@@ -832,100 +1075,166 @@ class VisionHMI:
 
     def save_gpio_selection(self, window):
         self.params["gpio_trigger_pin"].set(self.temp_selected_pin.get())
-        self.gpio_label.config(text=f"Pin: GPIO{self.params['gpio_trigger_pin'].get()}" if self.params['gpio_trigger_pin'].get() != -1 else "Pin: None")
+        self.update_gpio_label()
         self.save_settings()
+        self.start_trigger()
         window.destroy()
         self.show_toast("GPIO selection saved")
 
-    def start_gpio_simulation(self):
-        if self.gpio_thread and self.gpio_thread.is_alive():
-            self.params["gpio_trigger_pin"].set(-1)
-        if self.params["gpio_trigger_pin"].get() != -1:
-            def simulate_gpio():
-                while self.params["gpio_trigger_pin"].get() != -1:
-                    if self.mode.get() == "Run Mode":
-                        self.gpio_trigger_active = np.random.choice([True, False], p=[0.1, 0.9])
-                        if self.gpio_trigger_active:
-                            self.root.after(0, self.run_cycle_logic)
-                    time.sleep(0.5)
-            self.gpio_thread = threading.Thread(target=simulate_gpio, daemon=True)
-            self.gpio_thread.start()
+    def start_trigger(self):
+        pin = self.params["gpio_trigger_pin"].get()
+        debounce_ms = self.trigger_debounce_ms.get()
+        if self.trigger is not None and self.trigger_config == (pin, debounce_ms):
+            return  # already listening; restarting would reopen the FIFO or GPIO for nothing
+        self.stop_trigger()
+        # The edge is timestamped on the trigger thread; only the cycle start is marshalled to Tk
+        callback = lambda ts: self.root.after(0, lambda: self.on_trigger(ts))
+        try:
+            if pin != -1 and GPIO is not None:
+                self.trigger = GpioTrigger(pin, callback, debounce_ms)
+            else:
+                self.trigger = FifoTrigger(self.trigger_fifo, callback, debounce_ms)
+            self.trigger.start()
+            self.trigger_config = (pin, debounce_ms)
+        except Exception as e:
+            self.trigger = None
+            self.show_toast(f"Trigger setup error: {e}")
+
+    def stop_trigger(self):
+        if self.trigger:
+            try:
+                self.trigger.stop()
+            finally:
+                self.trigger = None
+
+    def on_trigger(self, trigger_ts):
+        if self.mode.get() == "Mode Réglage" or self.pipeline is not None:  # continuous mode inspects every frame anyway
+            return
+        if self.cycle_state != "Idle":
+            self.missed_triggers += 1
+            self.status_var.set(f"Trigger overrun ({self.missed_triggers} missed)")
+            return
+        self.run_cycle_logic(trigger_ts=trigger_ts)
+
+    def build_roi_overlay(self, frame_shape):
+        # ROI outlines and mask tints in display coordinates; rebuilt only when an ROI or the frame size changes
+        img_h, img_w = frame_shape[:2]
+        sx, sy = 400 / img_w, 300 / img_h
+        overlay = []
+        for roi in self.rois:
+            x, y, w, h, roi_id, angle, shape, mask = roi
+            center = (x + w / 2, y + h / 2)
+            item = {"id": roi_id, "shape": shape, "angle": angle,
+                    "center": (int(center[0] * sx), int(center[1] * sy)),
+                    "label": (int(x * sx), int(y * sy) - 10), "mask": None}
+            if shape == "rectangle":
+                M = cv2.getRotationMatrix2D(center, angle, 1)
+                points = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float32)
+                points = np.dot(points - center, M[:, :2].T) + center
+                item["points"] = (points * (sx, sy)).astype(np.int32)
+            else:  # circle
+                radius = min(w, h) // 2
+                item["axes"] = (max(1, int(radius * sx)), max(1, int(radius * sy)))
+                item["handle"] = (int((center[0] + radius * np.cos(np.radians(angle))) * sx),
+                                  int((center[1] + radius * np.sin(np.radians(angle))) * sy))
+            if not mask.empty:
+                x0, y0 = max(0, int(x * sx)), max(0, int(y * sy))
+                x1, y1 = min(400, int((x + w) * sx)), min(300, int((y + h) * sy))
+                if x1 > x0 and y1 > y0:
+                    small = cv2.resize(mask.array, (x1 - x0, y1 - y0), interpolation=cv2.INTER_NEAREST)
+                    mask_rgb = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+                    mask_rgb[small > 0] = (255, 0, 255)  # Magenta for mask
+                    item["mask"] = (x0, y0, x1, y1, mask_rgb)
+            overlay.append(item)
+        return overlay
+
+    def draw_roi_overlay(self, frame):
+        for item in self.roi_overlay:
+            roi_id = item["id"]
+            color = (255, 0, 0) if roi_id == self.selected_roi else (0, 255, 0) if roi_id == self.hovered_roi else (0, 200, 0)
+            center = item["center"]
+            if item["shape"] == "rectangle":
+                cv2.polylines(frame, [item["points"]], True, color, 1)
+            else:
+                cv2.ellipse(frame, center, item["axes"], item["angle"], 0, 360, color, 1)
+            if roi_id == self.selected_roi:
+                if item["shape"] == "rectangle":
+                    for px, py in item["points"]:
+                        cv2.circle(frame, (int(px), int(py)), 3, (255, 255, 0), -1)
+                else:
+                    cv2.circle(frame, item["handle"], 3, (255, 255, 0), -1)
+                cv2.circle(frame, center, 3, (0, 255, 255), -1)
+            cv2.putText(frame, f"ROI {roi_id}", item["label"], cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+            if item["mask"] is not None:
+                x0, y0, x1, y1, mask_rgb = item["mask"]
+                frame[y0:y1, x0:x1] = cv2.addWeighted(frame[y0:y1, x0:x1], 0.7, mask_rgb, 0.3, 0)
+
+    def refresh_roi_widgets(self):
+        roi_ids = [str(roi[4]) for roi in self.rois]
+        if roi_ids == self.listed_roi_ids:
+            return
+        self.listed_roi_ids = roi_ids
+        self.roi_listbox.delete(0, tk.END)
+        for roi_id in roi_ids:
+            self.roi_listbox.insert(tk.END, f"ROI {roi_id}")
+        if self.roi_id_menu is None:  # inspection tab not built yet
+            return
+        self.roi_id_menu["menu"].delete(0, tk.END)
+        for roi_id in roi_ids:
+            self.roi_id_menu["menu"].add_command(label=roi_id, command=lambda x=roi_id: self.roi_id_var.set(x))
 
     def update_video(self):
+        tick = time.perf_counter()
         try:
             if self.use_static_image:
-                frame = self.static_image.copy()
+                frame = self.static_image
+                if frame is None:  # camera still opening
+                    self.root.after(50, self.update_video)
+                    return
             else:
-                ret, frame = self.cap.read()
-                if not ret:
-                    self.show_toast("Failed to capture frame")
+                # No copy: the frame is only read by the resize below, well before the grabber reuses its slot
+                latest = self.grabber.latest("displayed", copy=False)
+                if latest is None:  # camera still warming up
+                    self.root.after(10, self.update_video)
                     return
+                frame = latest[2]
 
-            # Draw ROIs
-            for roi in self.rois:
-                x, y, w, h, roi_id, angle, shape, mask = roi
-                color = (255, 0, 0) if roi_id == self.selected_roi else (0, 255, 0) if roi_id == self.hovered_roi else (0, 200, 0)
-                center = (x + w // 2, y + h // 2)
-                if shape == "rectangle":
-                    M = cv2.getRotationMatrix2D(center, angle, 1)
-                    cos, sin = np.abs(M[0, 0]), np.abs(M[0, 1])
-                    new_w = int((h * sin) + (w * cos))
-                    new_h = int((h * cos) + (w * sin))
-                    M[0, 2] += (new_w - w) // 2
-                    M[1, 2] += (new_h - h) // 2
-                    points = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float32)
-                    points = np.dot(points - center, M[:, :2].T) + center
-                    points = points.astype(np.int32)
-                    cv2.polylines(frame, [points], True, color, 2)
-                else:  # circle
-                    radius = min(w, h) // 2
-                    cv2.ellipse(frame, (int(center[0]), int(center[1])), (radius, radius), angle, 0, 360, color, 2)
-                if roi_id == self.selected_roi:
-                    if shape == "rectangle":
-                        cv2.polylines(frame, [points], True, (255, 255, 255), 1)
-                        for px, py in points:
-                            cv2.circle(frame, (px, py), 5, (255, 255, 0), -1)
-                    else:
-                        cv2.ellipse(frame, (int(center[0]), int(center[1])), (radius, radius), angle, 0, 360, (255, 255, 255), 1)
-                        cv2.circle(frame, (int(center[0] + radius * np.cos(np.radians(angle))), int(center[1] + radius * np.sin(np.radians(angle)))), 5, (255, 255, 0), -1)
-                    cv2.circle(frame, (int(center[0]), int(center[1])), 5, (0, 255, 255), -1)
-                cv2.putText(frame, f"ROI {roi_id}", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                # Draw mask if present
-                if mask is not None and np.any(mask):
-                    mask_rgb = cv2.cvtColor(mask, cv2.COLOR_GRAY2RGB)
-                    mask_rgb[mask > 0] = (255, 0, 255)  # Magenta for mask
-                    frame[y:y+h, x:x+w] = cv2.addWeighted(frame[y:y+h, x:x+w], 0.7, mask_rgb, 0.3, 0)
+            # Downscale first so overlay drawing and colour conversion only touch display pixels
+            overlay_key = (self.roi_version, frame.shape)
+            if overlay_key != self.roi_overlay_key:
+                self.roi_overlay = self.build_roi_overlay(frame.shape)
+                self.roi_overlay_key = overlay_key
+            small = cv2.resize(frame, (400, 300), interpolation=cv2.INTER_LINEAR)
+            self.draw_roi_overlay(small)
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=small)
 
             # Update ROI info
+            roi_info = "ROI Info: None"
             if self.selected_roi is not None:
                 for roi in self.rois:
                     if roi[4] == self.selected_roi:
                         x, y, w, h, _, angle, shape, _ = roi
-                        self.roi_info_var.set(f"ROI {self.selected_roi}: X={x}, Y={y}, W={w}, H={h}, Angle={angle:.1f}°, Shape={shape}")
+                        roi_info = f"ROI {self.selected_roi}: X={x}, Y={y}, W={w}, H={h}, Angle={angle:.1f}°, Shape={shape}"
                         break
+            if roi_info != self.roi_info_var.get():
+                self.roi_info_var.set(roi_info)
+
+            # Reuse one PhotoImage and one canvas item instead of stacking a new item every tick
+            img = Image.fromarray(small)
+            if self.photo is None:
+                self.photo = ImageTk.PhotoImage(image=img)
+                self.video_item = self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
+                self.canvas.tag_lower(self.video_item)
             else:
-                self.roi_info_var.set("ROI Info: None")
-
-            # Convert to ImageTk
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            img = img.resize((400, 300), Image.Resampling.LANCZOS)
-            self.photo = ImageTk.PhotoImage(image=img)
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
-
-            # Update ROI list and menu
-            self.roi_listbox.delete(0, tk.END)
-            roi_ids = [str(roi[4]) for roi in self.rois]
-            for roi_id in roi_ids:
-                self.roi_listbox.insert(tk.END, f"ROI {roi_id}")
-            self.roi_id_menu["menu"].delete(0, tk.END)
-            for roi_id in roi_ids:
-                self.roi_id_menu["menu"].add_command(label=roi_id, command=lambda x=roi_id: self.roi_id_var.set(x))
-
-            self.led_ok.itemconfig("led_ok", fill="#28a745" if self.cycle_state == "Completed" else "#d4d4d4")
-            self.led_ng.itemconfig("led_ng", fill="#dc3545" if self.cycle_state.startswith("Failed") else "#d4d4d4")
-
-            self.root.after(10, self.update_video)
+                self.photo.paste(img)
+
+            self.refresh_roi_widgets()
+
+            fps = max(1.0, self.display_fps.get())
+            elapsed = time.perf_counter() - tick
+            self.metrics.observe("display", elapsed)
+            elapsed_ms = elapsed * 1000
+            self.root.after(max(1, int(1000 / fps - elapsed_ms)), self.update_video)
         except Exception as e:
             self.show_toast(f"Video update error: {e}")
 
@@ -1034,8 +1343,9 @@ class VisionHMI:
             img_y = int(y * scale_y)
             img_w = int(w * scale_x)
             img_h = int(h * scale_y)
-            mask = np.zeros((img_h, img_w), dtype=np.uint8)  # Create mask with image dimensions
+            mask = RoiMask.blank(img_h, img_w)  # Create mask with image dimensions
             self.rois.append((img_x, img_y, img_w, img_h, self.roi_id, 0.0, self.roi_shape.get(), mask))
+            self.roi_version += 1
             self.roi_id += 1
             self.show_toast(f"ROI {self.roi_id - 1} created")
         self.canvas.delete("temp_roi")
@@ -1060,8 +1370,10 @@ class VisionHMI:
                 x, y, w, h, _, _, _, mask = roi
                 rel_x, rel_y = event.x - x, event.y - y
                 if 0 <= rel_x < w and 0 <= rel_y < h:
-                    cv2.circle(mask, (int(rel_x), int(rel_y)), 5, 255, -1)
-                self.rois[i] = (x, y, w, h, roi[4], roi[5], roi[6], mask)
+                    mask_array = mask.array.copy()  # masks are shared with inspections, never edited in place
+                    cv2.circle(mask_array, (int(rel_x), int(rel_y)), 5, 255, -1)
+                    self.rois[i] = (x, y, w, h, roi[4], roi[5], roi[6], RoiMask.from_array(mask_array))
+                    self.roi_version += 1
                 break
 
     def end_mask(self, event):
@@ -1081,7 +1393,8 @@ class VisionHMI:
         for i, roi in enumerate(self.rois):
             if roi[4] == self.selected_roi:
                 x, y, w, h, rid, angle, shape, _ = roi
-                self.rois[i] = (x, y, w, h, rid, angle, shape, np.zeros((h, w), dtype=np.uint8))
+                self.rois[i] = (x, y, w, h, rid, angle, shape, RoiMask.blank(h, w))
+                self.roi_version += 1
                 self.show_toast(f"Mask cleared for ROI {rid}")
                 break
 
@@ -1138,6 +1451,7 @@ class VisionHMI:
                         new_x = round(new_x / grid_size) * grid_size
                         new_y = round(new_y / grid_size) * grid_size
                     self.rois[i] = (new_x, new_y, rw, rh, rid, angle, shape, mask)
+                    self.roi_version += 1
                     self.ix, self.iy = x, y
                 elif self.resizing:
                     if shape == "rectangle":
@@ -1150,13 +1464,15 @@ class VisionHMI:
                         grid_size = 10
                         new_w = round(new_w / grid_size) * grid_size
                         new_h = round(new_h / grid_size) * grid_size
-                    new_mask = cv2.resize(mask, (new_w, new_h), interpolation=cv2.INTER_NEAREST)
+                    new_mask = mask.resized(new_w, new_h)
                     self.rois[i] = (rx, ry, new_w, new_h, rid, angle, shape, new_mask)
+                    self.roi_version += 1
                     self.ix, self.iy = x, y
                 elif self.rotating:
                     dx, dy = x - center_x, y - center_y
                     new_angle = np.degrees(np.arctan2(dy, dx))
                     self.rois[i] = (rx, ry, rw, rh, rid, new_angle, shape, mask)
+                    self.roi_version += 1
                 break
 
     def end_move_resize_rotate(self, event):
@@ -1173,6 +1489,7 @@ class VisionHMI:
             return
         if self.selected_roi is not None:
             self.rois = [roi for roi in self.rois if roi[4] != self.selected_roi]
+            self.roi_version += 1
             self.show_toast(f"ROI {self.selected_roi} deleted")
             self.selected_roi = None
 
@@ -1181,6 +1498,7 @@ class VisionHMI:
             self.show_toast("Clear ROIs available only in Mode Réglage")
             return
         self.rois = []
+        self.roi_version += 1
         self.selected_roi = None
         self.roi_id = 0
         self.show_toast("All ROIs cleared")
@@ -1206,12 +1524,16 @@ class VisionHMI:
             return
         try:
             if self.use_static_image:
+                if self.static_image is None:
+                    self.show_toast("Camera still opening")
+                    return
                 frame = self.static_image.copy()
             else:
-                ret, frame = self.cap.read()
-                if not ret:
+                latest = self.grabber.latest()
+                if latest is None:
                     self.show_toast("Failed to capture frame")
                     return
+                frame = latest[2]
             x, y = event.x, event.y
             h, w = frame.shape[:2]
             x_scaled = int(x * w / 400.0)  
@@ -1230,421 +1552,514 @@ class VisionHMI:
         except Exception as e:
             self.show_toast(f"Color picking error: {e}")
 
-    def run_blob_detection(self, preview=False):
+    def get_settings(self):
+        # Rebuilt only after a Tk variable changed (see invalidate_settings), so inspections read plain values
+        if self.settings is None:
+            self.settings = freeze_settings({k: v.get() for k, v in self.params.items()},
+                                            {k: v.get() for k, v in self.judgment_criteria.items()},
+                                            {k: v.get() for k, v in self.blob_outputs.items()},
+                                            {k: v.get() for k, v in self.cycle_features.items()},
+                                            self.template_model)
+        return self.settings
+
+    def invalidate_settings(self, *args):
+        self.settings = None
+
+    def get_selected_roi_tuple(self):
+        for roi in self.rois:
+            if roi[4] == self.selected_roi:
+                return roi
+        return None
+
+    def report_result(self, res):
+        roi_id, inspection_type, result = res["roi_id"], res["inspection_type"], res["result"]
+        self.cycle_results.setdefault(roi_id, {})[inspection_type] = {"result": result, "details": res["details"], "value": res["value"]}
+        self.log_result(roi_id, inspection_type, result, res["details"], res["value"])
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(tk.END, f"{inspection_type} ROI {roi_id}: {result}\n")
+        if inspection_type == "Blob Detection":
+            for output, enabled in self.get_settings().blob_outputs.items():
+                if enabled:
+                    value = res["measurements"][output]
+                    if output in ["center_of_gravity", "positions", "orientation"]:
+                        value = "; ".join([f"({v[0]:.1f}, {v[1]:.1f})" if isinstance(v, tuple) else f"{v:.1f}" for v in value[:2]]) + ("..." if len(value) > 2 else "")
+                    elif output == "fill_percentage":
+                        value = f"{value:.2f}%"
+                    elif output in ["largest_area", "smallest_area", "total_area"]:
+                        value = f"{value:.1f} px²"
+                    self.result_text.insert(tk.END, f"{output.replace('_', ' ').title()}: {value}\n")
+        else:
+            self.result_text.insert(tk.END, f"{res['details']}\n")
+        self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
+
+    def show_preview(self, title, preview_img, label, result):
+        cv2.putText(preview_img, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0) if result == "OK" else (0, 0, 255), 2)
+        cv2.imshow(title, cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
+        cv2.waitKey(1)
+
+    def run_blob_detection(self, preview=False, ctx=None):
         if not self.validate_selected_roi():
             return
         if not self.validate_parameters(["blob_threshold_value", "blob_area_min", "blob_area_max", "blob_width_min", "blob_width_max",
                                         "blob_height_min", "blob_height_max", "blob_circularity_min", "blob_circularity_max",
-                                        "blob_aspect_ratio_min", "blob_aspect_ratio_max", "blob_soldity_min", "blob_soldity_max",
+                                        "blob_aspect_ratio_min", "blob_aspect_ratio_max", "blob_solidity_min", "blob_solidity_max",
                                         "blob_rgb_r_min", "blob_rgb_r_max", "blob_rgb_g_min", "blob_rgb_g_max",
                                         "blob_rgb_b_min", "blob_rgb_b_max", "blob_hsv_h_min", "blob_hsv_h_max",
                                         "blob_hsv_s_min", "blob_hsv_s_max", "blob_hsv_v_min", "blob_hsv_v_max",
                                         "blob_count_min", "blob_count_max"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                def end_roi(self, event):
-                    if not self.drawing:
-                        return
-                    self.drawing = False
-                    x, y = min(self.ix, event.x), min(self.iy, event.y)
-                    w, h = abs(event.x - self.ix), abs(event.y - self.iy)
-                    if self.snap_to_grid.get():
-                        grid_size = 10
-                        x, y = round(x / grid_size) * grid_size, round(y / grid_size) * grid_size
-                        w, h = round(w / grid_size) * grid_size, round(h / grid_size) * grid_size
-                    if w > 10 and h > 10:
-                        mask = np.zeros((h, w), dtype=np.uint8)
-                        self.rois.append((x, y, w, h, self.roi_id, 0.0, self.roi_shape.get(), mask))
-                        self.roi_id += 1
-                        self.show_toast(f"ROI {self.roi_id - 1} created")
-                        self.update_roi_id_menu()  # Ajouter cette ligne
-                    self.canvas.delete("temp_roi")
-                    self.status_var.set(f"Ready | {self.mode.get()}")
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    if self.params["blob_color_mode"].get() == "Grayscale":
-                        gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY)
-                        if self.params["blob_threshold_manual"].get():
-                            thresh = cv2.threshold(gray, self.params["blob_threshold_value"].get(), 255, cv2.THRESH_BINARY)[1]
-                        else:
-                            thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-                    elif self.params["blob_color_mode"].get() == "RGB":
-                        lower_rgb = (self.params["blob_rgb_b_min"].get(), self.params["blob_rgb_g_min"].get(), self.params["blob_rgb_r_min"].get())
-                        upper_rgb = (self.params["blob_rgb_b_max"].get(), self.params["blob_rgb_g_max"].get(), self.params["blob_rgb_r_max"].get())
-                        thresh = cv2.inRange(roi_img, lower_rgb, upper_rgb)
-                    else:  # HSV
-                        hsv = cv2.cvtColor(roi_img, cv2.COLOR_RGB2HSV)
-                        lower_hsv = (self.params["blob_hsv_h_min"].get(), self.params["blob_hsv_s_min"].get(), self.params["blob_hsv_v_min"].get())
-                        upper_hsv = (self.params["get_hsv_h_max"].get(), self.params["blob_hsv_s_max"].get(), self.params["blob_hsv_v_max"].get())
-                        thresh = cv2.inRange(hsv, lower_hsv, upper_hsv)
-                    if np.any(mask):
-                        thresh = thresh & mask
-                    # Apply bilateral filter
-                    thresh = cv2.bilateralFilter(thresh, 11, self.params["blob_bilateral_sigma"].get(), self.params["blob_bilateral_sigma"].get())
-                    # Find contours
-                    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                    # Filter contours
-                    filtered_blobs = []
-                    blob_measurements = {
-                        "count": 0,
-                        "largest_area": 0,
-                        "smallest_area": float("inf"),
-                        "center_of_gravity": [],
-                        "positions": [],
-                        "orientation": [],
-                        "total_area": 0,
-                        "fill_percentage": 0
-                    }
-                    for contour in contours:
-                        area = cv2.contourArea(contour)
-                        if not (self.params["blob_area_min"].get() <= area <= self.params["blob_area_max"].get()):
-                            continue
-                        x_b, y_b, w_b, h_b = cv2.boundingRect(contour)
-                        if not (self.params["blob_width_min"].get() <= w_b <= self.params["blob_width_max"].get() and
-                                self.params["blob_height_min"].get() <= h_b <= self.params["blob_height_max"].get()):
-                            continue
-                        # Shape filters
-                        perimeter = cv2.arcLength(contour, True)
-                        circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0
-                        if not (self.params["blob_circularity_min"].get() <= circularity <= self.params["blob_circularity_max"].get()):
-                            continue
-                        aspect_ratio = w_b / h_b if h_b > 0 else 0
-                        if not (self.params["blob_aspect_ratio_min"].get() <= aspect_ratio <= self.params["blob_aspect_ratio_max"].get()):
-                            continue
-                        hull = cv2.convexHull(contour)
-                        hull_area = cv2.contourArea(hull)
-                        solidity = area / hull_area if hull_area > 0 else 0
-                        if not (self.params["blob_solidity_min"].get() <= solidity <= self.params["blob_solidity_max"].get()):
-                            continue
-                        # Bounding shape match
-                        if self.params["blob_bounding_shape"].get() == "Rectangle":
-                            rect = cv2.minAreaRect(contour)
-                            box = cv2.boxPoints(rect)
-                            box_area = cv2.contourArea(np.int32([box]))
-                            if box_area == 0 or area / box_area < 0.8:
-                                continue
-                        elif self.params["blob_bounding_shape"].get() == "Circle":
-                            (cx, cy), radius = cv2.minEnclosingCircle(contour)
-                            circle_area = np.pi * radius ** 2
-                            if circle_area == 0 or area / circle_area < 0.8:
-                                continue
-                        # Boundary exclusion
-                        if self.params["boundary_exclusion"].get():
-                            if x_b <= 2 or y_b <= 2 or x_b + w_b >= w - 2 or y_b + h_b >= h - 2:
-                                continue
-                        filtered_blobs.append(contour)
-                        # Update measurements
-                        blob_measurements["count"] += 1
-                        blob_measurements["largest_area"] = max(blob_measurements["largest_area"], area)
-                        blob_measurements["smallest_area"] = min(blob_measurements["smallest_area"], area)
-                        M = cv2.moments(contour)
-                        cx = M["m10"] / M["m00"] if M["m00"] > 0 else 0
-                        cy = M["m01"] / M["m00"] if M["m00"] > 0 else 0
-                        blob_measurements["center_of_gravity"].append((cx + x, cy + y))
-                        blob_measurements["positions"].append((x_b + x, y_b + y, w_b, h_b))
-                        if len(contour) >= 5:
-                            ellipse = cv2.fitEllipse(contour)
-                            blob_measurements["orientation"].append(ellipse[2])
-                        blob_measurements["total_area"] += area
-                    if blob_measurements["count"] > 0:
-                        blob_measurements["fill_percentage"] = blob_measurements["total_area"] / (w * h) * 100
-                    else:
-                        blob_measurements["smallest_area"] = 0
-                    # Judgment criteria
-                    result = "OK"
-                    details = []
-                    if self.judgment_criteria["criteria_type"].get() == "At least one blob":
-                        if blob_measurements["count"] < 1:
-                            result = "NG"
-                            details.append("No blobs detected")
-                    else:  # Blob count limit
-                        if not (self.judgment_criteria["blob_count_min"].get() <= blob_measurements["count"] <= self.judgment_criteria["blob_count_max"].get()):
-                            result = "NG"
-                            details.append(f"Blob count {blob_measurements['count']} outside range [{self.judgment_criteria['blob_count_min'].get()}, {self.judgment_criteria['blob_count_max'].get()}]")
-                    for contour in filtered_blobs:
-                        area = cv2.contourArea(contour)
-                        if not (self.judgment_criteria["blob_area_min"].get() <= area <= self.judgment_criteria["blob_area_max"].get()):
-                            result = "NG"
-                            details.append(f"Blob area {area:.1f} outside range [{self.judgment_criteria['blob_area_min'].get()}, {self.judgment_criteria['blob_area_max'].get()}]")
-                    # Log results
-                    self.log_result(roi[4], "Blob Detection", result, "; ".join(details) or "Passed")
-                    # Display results
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Blob Detection ROI {roi[4]}: {result}\n")
-                    for output, enabled in self.blob_outputs.items():
-                        if enabled.get():
-                            value = blob_measurements[output]
-                            if output in ["center_of_gravity", "positions", "orientation"]:
-                                value = "; ".join([f"({v[0]:.1f}, {v[1]:.1f})" if isinstance(v, tuple) else f"{v:.1f}" for v in value[:2]]) + ("..." if len(value) > 2 else "")
-                            elif output == "fill_percentage":
-                                value = f"{value:.2f}%"
-                            elif output in ["largest_area", "smallest_area", "total_area"]:
-                                value = f"{value:.1f} px²"
-                            self.result_text.insert(tk.END, f"{output.replace('_', ' ').title()}: {value}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    # Preview
-                    if preview:
-                        preview_img = roi_img.copy()
-                        for contour in filtered_blobs:
-                            cv2.drawContours(preview_img, [contour], -1, (0, 255, 0), 2)
-                        cv2.imshow(f"Blob Detection Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_blobs(ctx, roi, self.get_settings().params, self.get_settings().judgment_criteria)
+                self.report_result(res)
+                if preview:
+                    preview_img = ctx.crop(roi).copy()
+                    for contour in res["artifacts"]["contours"]:
+                        cv2.drawContours(preview_img, [contour], -1, (0, 255, 0), 2)
+                    cv2.imshow(f"Blob Detection Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
+                    cv2.waitKey(1)
         except Exception as e:
             self.show_toast(f"Blob detection error: {e}")
 
-    def run_density_inspection(self, preview=False):
+    def run_density_inspection(self, preview=False, ctx=None):
         if not self.validate_selected_roi() or not self.validate_parameters(["density_threshold_min", "density_threshold_max"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY)
-                    if np.any(mask):
-                        gray = cv2.bitwise_and(gray, gray, mask=mask)
-                    mean_density = np.mean(gray[gray > 0]) if np.any(gray > 0) else 0
-                    min_density, max_density = self.params["density_threshold_min"].get(), self.params["density_threshold_max"].get()
-                    result = "OK" if min_density <= mean_density <= max_density else "NG"
-                    details = f"Mean Density: {mean_density:.2f} (Range: [{min_density}, {max_density}])"
-                    self.log_result(roi[4], "Density Inspection", result, details)
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Density Inspection ROI {roi[4]}: {result}\n{details}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    if preview:
-                        preview_img = roi_img.copy()
-                        cv2.putText(preview_img, f"Density: {mean_density:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0) if result == "OK" else (0, 0, 255), 2)
-                        cv2.imshow(f"Density Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_density(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    self.show_preview(f"Density Preview ROI {roi[4]}", ctx.crop(roi).copy(), f"Density: {res['value']:.2f}", res["result"])
         except Exception as e:
             self.show_toast(f"Density inspection error: {e}")
 
-    def run_contrast_inspection(self, preview=False):
+    def run_contrast_inspection(self, preview=False, ctx=None):
         if not self.validate_selected_roi() or not self.validate_parameters(["contrast_threshold_min", "contrast_threshold_max"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY)
-                    if np.any(mask):
-                        gray = cv2.bitwise_and(gray, gray, mask=mask)
-                    contrast = np.std(gray[gray > 0]) if np.any(gray > 0) else 0
-                    min_contrast, max_contrast = self.params["contrast_threshold_min"].get(), self.params["contrast_threshold_max"].get()
-                    result = "OK" if min_contrast <= contrast <= max_contrast else "NG"
-                    details = f"Contrast: {contrast:.2f} (Range: [{min_contrast}, {max_contrast}])"
-                    self.log_result(roi[4], "Contrast Inspection", result, details)
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Contrast Inspection ROI {roi[4]}: {result}\n{details}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    if preview:
-                        preview_img = roi_img.copy()
-                        cv2.putText(preview_img, f"Contrast: {contrast:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0) if result == "OK" else (0, 0, 255), 2)
-                        cv2.imshow(f"Contrast Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_contrast(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    self.show_preview(f"Contrast Preview ROI {roi[4]}", ctx.crop(roi).copy(), f"Contrast: {res['value']:.2f}", res["result"])
         except Exception as e:
             self.show_toast(f"Contrast inspection error: {e}")
 
-    def run_edge_inspection(self, preview=False):
+    def run_edge_inspection(self, preview=False, ctx=None):
         if not self.validate_selected_roi() or not self.validate_parameters(["edge_threshold_min", "edge_threshold_max", "edge_canny_low", "edge_canny_high"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY)
-                    if np.any(mask):
-                        gray = cv2.bitwise_and(gray, gray, mask=mask)
-                    gray = cv2.medianBlur(gray, self.params["edge_median_blur"].get())
-                    edges = cv2.Canny(gray, self.params["edge_canny_low"].get(), self.params["edge_canny_high"].get())
-                    edge_sum = np.sum(edges) / 255
-                    min_edge, max_edge = self.params["edge_threshold_min"].get(), self.params["edge_threshold_max"].get()
-                    result = "OK" if min_edge <= edge_sum <= max_edge else "NG"
-                    details = f"Edge Sum: {edge_sum:.2f} (Range: [{min_edge}, {max_edge}])"
-                    self.log_result(roi[4], "Edge Inspection", result, details)
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Edge Inspection ROI {roi[4]}: {result}\n{details}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    if preview:
-                        preview_img = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-                        cv2.putText(preview_img, f"Edge Sum: {edge_sum:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0) if result == "OK" else (0, 0, 255), 2)
-                        cv2.imshow(f"Edge Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_edge(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    preview_img = cv2.cvtColor(res["artifacts"]["edges"], cv2.COLOR_GRAY2RGB)
+                    self.show_preview(f"Edge Preview ROI {roi[4]}", preview_img, f"Edge Sum: {res['value']:.2f}", res["result"])
         except Exception as e:
             self.show_toast(f"Edge inspection error: {e}")
 
-    def run_color_detection(self, preview=False):
+    def set_template(self, image):
+        # The template pyramid is built here, once, not on every match
+        self.template_image = image
+        self.template_model = TemplateModel(image) if image is not None else None
+        self.invalidate_settings()
+        self.update_template_label()
+
+    def update_template_label(self):
+        if self.template_label is None:
+            return
+        if self.template_model is not None:
+            height, width = self.template_image.shape[:2]
+            self.template_label.config(text=f"{width}x{height}, {len(self.template_model.levels)} levels")
+        else:
+            self.template_label.config(text="No template")
+
+    def update_gpio_label(self):
+        if self.gpio_label is not None:
+            pin = self.params['gpio_trigger_pin'].get()
+            self.gpio_label.config(text=f"Pin: GPIO{pin}" if pin != -1 else "Pin: None")
+
+    def capture_template(self):
+        if self.mode.get() != "Mode Réglage":
+            self.show_toast("Template capture available only in Mode Réglage")
+            return
+        if not self.validate_selected_roi():
+            return
+        try:
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                self.set_template(InspectionContext(self.get_image()).crop(roi).copy())
+                self.show_toast(f"Template captured from ROI {roi[4]}")
+        except Exception as e:
+            self.show_toast(f"Template capture error: {e}")
+
+    def load_template(self):
+        if self.mode.get() != "Mode Réglage":
+            self.show_toast("Template loading available only in Mode Réglage")
+            return
+        filename = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.png *.bmp")])
+        if filename:
+            image = cv2.imread(filename)
+            if image is None:
+                self.show_toast("Could not read template image")
+                return
+            self.set_template(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            self.show_toast("Template loaded")
+
+    def run_template_matching(self, preview=False, ctx=None):
+        if not self.validate_selected_roi() or not self.validate_parameters(["template_threshold_min", "template_threshold_max"]):
+            return
+        try:
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_template(ctx, roi, self.get_settings().params, self.template_model)
+                self.report_result(res)
+                if preview:
+                    preview_img = ctx.crop(roi).copy()
+                    if "box" in res["artifacts"]:
+                        bx, by, bw, bh = res["artifacts"]["box"]
+                        cv2.rectangle(preview_img, (bx, by), (bx + bw, by + bh), (0, 255, 0) if res["result"] == "OK" else (255, 0, 0), 2)
+                    self.show_preview(f"Template Preview ROI {roi[4]}", preview_img, f"Score: {res['value']:.3f}", res["result"])
+        except Exception as e:
+            self.show_toast(f"Template matching error: {e}")
+
+    def run_contour_analysis(self, preview=False, ctx=None):
+        if not self.validate_selected_roi() or not self.validate_parameters(["contour_area_threshold_min", "contour_area_threshold_max",
+                                                                            "contour_perimeter_min", "contour_perimeter_max",
+                                                                            "contour_circularity_min", "contour_circularity_max"]):
+            return
+        try:
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_contours(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    preview_img = ctx.crop(roi).copy()
+                    cv2.drawContours(preview_img, res["artifacts"]["contours"], -1, (255, 255, 0), 1)
+                    if "largest" in res["artifacts"]:
+                        cv2.drawContours(preview_img, [res["artifacts"]["largest"]], -1, (0, 255, 0) if res["result"] == "OK" else (255, 0, 0), 2)
+                    self.show_preview(f"Contour Preview ROI {roi[4]}", preview_img, f"Area: {res['value']:.1f}", res["result"])
+        except Exception as e:
+            self.show_toast(f"Contour analysis error: {e}")
+
+    def run_color_detection(self, preview=False, ctx=None):
         if not self.validate_selected_roi() or not self.validate_parameters(["color_hue_min", "color_hue_max", "color_saturation_min", "color_saturation_max", "color_brightness_min", "color_brightness_max", "color_ratio_min", "color_ratio_max"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    hsv = cv2.cvtColor(roi_img, cv2.COLOR_RGB2HSV)
-                    lower = (self.params["color_hue_min"].get(), self.params["color_saturation_min"].get(), self.params["color_brightness_min"].get())
-                    upper = (self.params["color_hue_max"].get(), self.params["color_saturation_max"].get(), self.params["color_brightness_max"].get())
-                    color_mask = cv2.inRange(hsv, lower, upper)
-                    if np.any(mask):
-                        color_mask = cv2.bitwise_and(color_mask, mask)
-                    ratio = np.sum(color_mask) / (w * h * 255) * 100
-                    min_ratio, max_ratio = self.params["color_ratio_min"].get(), self.params["color_ratio_max"].get()
-                    result = "OK" if min_ratio <= ratio <= max_ratio else "NG"
-                    details = f"Color Ratio: {ratio:.2f}% (Range: [{min_ratio}, {max_ratio}])"
-                    self.log_result(roi[4], "Color Detection", result, details)
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Color Detection ROI {roi[4]}: {result}\n{details}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    if preview:
-                        preview_img = roi_img.copy()
-                        preview_img[color_mask > 0] = (0, 255, 0)
-                        cv2.putText(preview_img, f"Ratio: {ratio:.2f}%", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
-                        cv2.imshow(f"Color Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_color(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    preview_img = ctx.crop(roi).copy()
+                    color_mask = res["artifacts"]["color_mask"]
+                    if color_mask.shape != preview_img.shape[:2]:  # computed at a reduced processing scale
+                        color_mask = cv2.resize(color_mask, (preview_img.shape[1], preview_img.shape[0]), interpolation=cv2.INTER_NEAREST)
+                    preview_img[color_mask > 0] = (0, 255, 0)
+                    cv2.putText(preview_img, f"Ratio: {res['value']:.2f}%", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+                    cv2.imshow(f"Color Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
+                    cv2.waitKey(1)
         except Exception as e:
             self.show_toast(f"Color detection error: {e}")
 
-    def run_measurement(self, preview=False):
+    def run_measurement(self, preview=False, ctx=None):
         if not self.validate_selected_roi() or not self.validate_parameters(["measurement_tolerance_min", "measurement_tolerance_max"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY)
-                    if np.any(mask):
-                        gray = cv2.bitwise_and(gray, gray, mask=mask)
-                    edges = cv2.Canny(gray, 100, 200)
-                    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                    if contours:
-                        largest_contour = max(contours, key=cv2.contourArea)
-                        area = cv2.contourArea(largest_contour)
-                        min_area, max_area = w * h * self.params["measurement_tolerance_min"].get(), w * h * self.params["measurement_tolerance_max"].get()
-                        result = "OK" if min_area <= area <= max_area else "NG"
-                        details = f"Area: {area:.2f} px² (Range: [{min_area:.2f}, {max_area:.2f}])"
-                    else:
-                        result = "NG"
-                        details = "No contours found"
-                    self.log_result(roi[4], "Measurement", result, details)
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Measurement ROI {roi[4]}: {result}\n{details}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    if preview:
-                        preview_img = roi_img.copy()
-                        if contours:
-                            cv2.drawContours(preview_img, [largest_contour], -1, (0, 255, 0), 2)
-                        cv2.putText(preview_img, f"Area: {area:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0) if result == "OK" else (0, 0, 255), 2)
-                        cv2.imshow(f"Measurement Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_measurement(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    preview_img = ctx.crop(roi).copy()
+                    if res["artifacts"]["contour"] is not None:
+                        cv2.drawContours(preview_img, [res["artifacts"]["contour"]], -1, (0, 255, 0), 2)
+                    self.show_preview(f"Measurement Preview ROI {roi[4]}", preview_img, f"Area: {res['value']:.2f}", res["result"])
         except Exception as e:
             self.show_toast(f"Measurement error: {e}")
 
-    def run_focus_check(self, preview=False):
+    def run_focus_check(self, preview=False, ctx=None):
         if not self.validate_selected_roi() or not self.validate_parameters(["focus_threshold_min", "focus_threshold_max"]):
             return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                if roi[4] == self.selected_roi:
-                    x, y, w, h, _, _, _, mask = roi
-                    roi_img = img[y:y+h, x:x+w]
-                    gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY)
-                    if np.any(mask):
-                        gray = cv2.bitwise_and(gray, gray, mask=mask)
-                    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-                    min_focus, max_focus = self.params["focus_threshold_min"].get(), self.params["focus_threshold_max"].get()
-                    result = "OK" if min_focus <= laplacian_var <= max_focus else "NG"
-                    details = f"Focus Variance: {laplacian_var:.2f} (Range: [{min_focus}, {max_focus}])"
-                    self.log_result(roi[4], "Focus Check", result, details)
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Focus Check ROI {roi[4]}: {result}\n{details}\n")
-                    self.result_text.tag_add("green" if result == "OK" else "red", "1.0", "1.end")
-                    if preview:
-                        preview_img = roi_img.copy()
-                        cv2.putText(preview_img, f"Focus: {laplacian_var:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0) if result == "OK" else (0, 0, 255), 2)
-                        cv2.imshow(f"Focus Preview ROI {roi[4]}", cv2.cvtColor(preview_img, cv2.COLOR_RGB2BGR))
-                        cv2.waitKey(1)
-                    break
+            ctx = ctx or InspectionContext(self.get_image())
+            roi = self.get_selected_roi_tuple()
+            if roi is not None:
+                res = inspect_focus(ctx, roi, self.get_settings().params)
+                self.report_result(res)
+                if preview:
+                    self.show_preview(f"Focus Preview ROI {roi[4]}", ctx.crop(roi).copy(), f"Focus: {res['value']:.2f}", res["result"])
         except Exception as e:
             self.show_toast(f"Focus check error: {e}")
 
-    def run_cycle_logic(self):
+    def run_cycle_logic(self, trigger_ts=None, on_done=None):
+        # Reads the Tk state, then hands the cycle to a worker thread; finish_cycle() reports it.
+        # on_done(overall_result) is called on the Tk thread once the cycle is reported.
         if self.cycle_state != "Idle":
             self.show_toast("Cycle already running")
             return
         if not self.rois:
             self.show_toast("No ROIs defined")
             return
+        try:
+            settings = self.get_settings()
+            if not self.validate_parameters(list(settings.params.keys())):
+                raise Exception("Invalid parameter range")
+            executor = self.get_cycle_executor()
+            archive = self.configure_archiver()
+        except Exception as e:
+            self.show_toast(f"Cycle error: {e}")
+            return
         self.cycle_state = "Running"
+        self.cycle_id += 1
+        self.active_cycle_id = self.cycle_id
+        self.cycle_on_done = on_done
         self.cycle_label.config(text="Cycle State: Running")
         self.progress["value"] = 0
+        threading.Thread(target=self.cycle_worker, args=(self.cycle_id, list(self.rois), settings, executor, trigger_ts, archive),
+                         name="cycle", daemon=True).start()
+
+    def configure_archiver(self):
+        # Tk thread: push the archive options to the archiver; returns whether archiving is on
+        self.archiver.configure(image_format=self.archive_format.get(), png_level=self.archive_png_level.get(),
+                                jpeg_quality=self.archive_jpeg_quality.get(), ok_every=self.archive_ok_every.get(),
+                                quota_bytes=self.archive_quota_mb.get() * 1024 * 1024)
+        return self.archive_enabled.get()
+
+    def cycle_worker(self, cycle_id, rois, settings, executor, trigger_ts, archive=False):
+        # Worker thread: no Tk calls here, everything the UI needs goes through cycle_queue
+        metrics = self.metrics
+        cycle_start = time.perf_counter()
+        frame_ts = None
+        try:
+            with metrics.time("cycle image"):
+                frame_ts, frame = self.get_frame(newer_than=trigger_ts)
+            futures = submit_cycle(executor, InspectionContext(frame), rois, settings, metrics)
+            results = []
+            for i, future in enumerate(futures):
+                res = future.result()
+                results.append(res)
+                self.log_result(res["roi_id"], res["inspection_type"], res["result"], res["details"], res["value"], cycle_id)
+                self.cycle_queue.put(("progress", cycle_id, i + 1, len(futures)))
+            overall_result, error = overall_verdict(results), None
+            if archive:
+                self.archiver.submit(frame, cycle_id, overall_result, rois, results)
+        except Exception as e:
+            results, overall_result, error = [], "NG", str(e)
+        elapsed = time.perf_counter() - cycle_start
+        metrics.observe("cycle", elapsed)
+        self.cycle_queue.put(("done", cycle_id, overall_result, results, error, elapsed, trigger_ts, frame_ts, time.monotonic()))
+
+    def drain_cycle_queue(self):
+        # Everything posted since the last tick becomes one progress bar update and at most one cycle report
+        progress, done, parts = None, None, []
+        try:
+            while True:
+                message = self.cycle_queue.get_nowait()
+                if message[0] == "progress":
+                    progress = message
+                elif message[0] == "part":
+                    parts.append(message[1])
+                else:
+                    done = message
+        except queue.Empty:
+            pass
+        if parts:
+            with self.metrics.time("ui update"):
+                self.report_parts(parts)
+        if progress is not None and done is None:
+            _, _, completed, total = progress
+            self.progress["value"] = completed / total * 100
+        if done is not None:
+            with self.metrics.time("ui update"):
+                self.finish_cycle(*done[1:])
+        self.root.after(self.cycle_poll_ms, self.drain_cycle_queue)
+
+    def finish_cycle(self, cycle_id, overall_result, results, error, elapsed, trigger_ts, frame_ts, verdict_ts):
+        on_done, self.cycle_on_done = self.cycle_on_done, None
+        self.active_cycle_id = None
+        self.progress["value"] = 100
+        self.cycle_state = "Idle"
+        self.cycle_label.config(text="Cycle State: Idle")
+        self.set_leds(overall_result)
+        if error is not None:
+            self.show_toast(f"Cycle error: {error}")
+            if on_done:
+                on_done(overall_result)
+            return
         self.cycle_results = {}
-        total_steps = sum(1 for _, enabled in self.cycle_features.items() if enabled.get()) * len(self.rois)
-        step = 100 / total_steps if total_steps > 0 else 100
-        current_step = 0
+        for res in results:
+            self.cycle_results.setdefault(res["roi_id"], {})[res["inspection_type"]] = {
+                "result": res["result"], "details": res["details"], "value": res["value"]}
+            self.spc.add(res)
+        self.update_spc_view()
+        failed = [res for res in results if res["result"] != "OK"]
+        summary = f"Cycle {cycle_id}: {overall_result} ({len(results) - len(failed)}/{len(results)} OK)\n"
+        summary += "".join(f"{res['inspection_type']} ROI {res['roi_id']}: {res['details']}\n" for res in failed)
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(tk.END, summary)
+        self.result_text.tag_add("green" if overall_result == "OK" else "red", "1.0", "1.end")
+        status = f"Cycle {elapsed * 1000:.0f} ms | {self.metrics.rate('display'):.1f} FPS"
+        if trigger_ts is not None:
+            _, _, total_ms = self.latency_log.add(trigger_ts, frame_ts, verdict_ts)
+            status += f" | Trigger→verdict {total_ms:.0f} ms (p95 {self.latency_log.summary()['p95_ms']:.0f} ms)"
+        self.set_perf_status(status)
+        self.show_toast(f"Cycle completed: {overall_result}")
+        if on_done:
+            on_done(overall_result)
+
+    def toggle_continuous(self):
+        if self.pipeline is not None:
+            self.stop_continuous()
+        else:
+            self.start_continuous()
 
+    def start_continuous(self):
+        # Every new camera frame is a part; settings and ROIs are frozen until the pipeline is stopped
+        if self.cycle_state != "Idle":
+            self.show_toast("Cycle already running")
+            return
+        if not self.rois:
+            self.show_toast("No ROIs defined")
+            return
         try:
-            img = self.get_image()
-            for roi in self.rois:
-                roi_id = roi[4]
-                self.cycle_results[roi_id] = {}
-                self.selected_roi = roi_id
-                for feature, enabled in self.cycle_features.items():
-                    if not enabled.get():
-                        continue
-                    if feature == "Density":
-                        self.run_density_inspection()
-                    elif feature == "Contrast":
-                        self.run_contrast_inspection()
-                    elif feature == "Edge":
-                        self.run_edge_inspection()
-                    elif feature == "Blob Detection":
-                        self.run_blob_detection()
-                    elif feature == "Color Detection":
-                        self.run_color_detection()
-                    elif feature == "Measurement":
-                        self.run_measurement()
-                    elif feature == "Focus Check":
-                        self.run_focus_check()
-                    current_step += step
-                    self.progress["value"] = current_step
-                    self.root.update()
-            overall_result = "OK"
-            for roi_id, results in self.cycle_results.items():
-                for insp_type, res in results.items():
-                    if res["result"] == "NG":
-                        overall_result = "NG"
-                        break
-                if overall_result == "NG":
-                    break
-            self.cycle_state = "Completed" if overall_result == "OK" else "Failed"
-            self.cycle_label.config(text=f"Cycle State: {self.cycle_state}")
-            self.show_toast(f"Cycle completed: {overall_result}")
+            settings = self.get_settings()
+            if not self.validate_parameters(list(settings.params.keys())):
+                raise Exception("Invalid parameter range")
+            executor = self.get_cycle_executor()
+            self.pipeline_archive = self.configure_archiver()
+            last_ts = [None]
+            def source():
+                if self.use_static_image:
+                    # A still image is one part, not one per call: wait for the next image to be loaded
+                    latest = self.next_static_frame(newer_than=last_ts[0])
+                    if latest is None:
+                        return None
+                    last_ts[0], frame = latest
+                else:
+                    last_ts[0], frame = self.get_frame(newer_than=last_ts[0])
+                return last_ts[0], frame
+            rois = list(self.rois)  # the pipeline threads outlive self.pipeline when stopping
+            self.pipeline_cycle_base = self.cycle_id
+            self.pipeline = InspectionPipeline(source, rois, settings, lambda part: self.on_pipeline_part(part, rois),
+                                               queue_size=max(1, self.pipeline_queue_size.get()),
+                                               policy=self.pipeline_policy.get(), executor=executor, metrics=self.metrics)
         except Exception as e:
-            self.cycle_state = "Failed"
-            self.cycle_label.config(text="Cycle State: Failed")
-            self.show_toast(f"Cycle error: {e}")
-        finally:
-            self.progress["value"] = 100
-            self.cycle_state = "Idle"
-            self.cycle_label.config(text="Cycle State: Idle")
+            self.pipeline = None
+            self.show_toast(f"Continuous mode error: {e}")
+            return
+        self.cycle_state = "Continuous"
+        self.cycle_label.config(text="Cycle State: Continuous")
+        self.continuous_button.config(text=" Stop Continuous")
+        self.pipeline.start()
+        self.update_pipeline_status()
+
+    def stop_continuous(self):
+        pipeline, self.pipeline = self.pipeline, None
+        pipeline.stop()
+        if self.pipeline_status_job is not None:
+            self.root.after_cancel(self.pipeline_status_job)
+            self.pipeline_status_job = None
+        self.pipeline_label.config(text="Continuous: stopped")
+        self.cycle_id = self.pipeline_cycle_base + pipeline.counters["captured"]
+        self.cycle_state = "Idle"
+        self.cycle_label.config(text="Cycle State: Idle")
+        self.continuous_button.config(text=" Start Continuous")
+
+    def on_pipeline_part(self, part, rois):
+        # Pipeline judge thread: log every judged part, then hand it to the Tk thread
+        cycle_id = self.pipeline_cycle_base + part.seq
+        if part.error is not None:
+            self.log_result(None, "Cycle", "NG", f"Part not inspected: {part.error}", None, cycle_id)
+        for res in part.results:
+            self.log_result(res["roi_id"], res["inspection_type"], res["result"], res["details"], res["value"], cycle_id)
+        if self.pipeline_archive and part.frame is not None:
+            self.archiver.submit(part.frame, cycle_id, part.verdict, rois, part.results)
+        part.frame = None  # the UI only needs the results
+        self.cycle_queue.put(("part", part))
+
+    def report_parts(self, parts):
+        # All parts finished since the last tick: SPC gets every one, the display shows the newest
+        for part in parts:
+            for res in part.results:
+                self.spc.add(res)
+        self.update_spc_view()
+        last = next((part for part in reversed(parts) if part.error is None), parts[-1])
+        self.set_leds(last.verdict)
+        if last.results:
+            self.cycle_results = {}
+            for res in last.results:
+                self.cycle_results.setdefault(res["roi_id"], {})[res["inspection_type"]] = {
+                    "result": res["result"], "details": res["details"], "value": res["value"]}
+        failed = [res for res in last.results if res["result"] != "OK"]
+        summary = f"Part {self.pipeline_cycle_base + last.seq}: {last.verdict}"
+        summary += f" (not inspected: {last.error})\n" if last.error else f" ({len(last.results) - len(failed)}/{len(last.results)} OK)\n"
+        summary += "".join(f"{res['inspection_type']} ROI {res['roi_id']}: {res['details']}\n" for res in failed)
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(tk.END, summary)
+        self.result_text.tag_add("green" if last.verdict == "OK" else "red", "1.0", "1.end")
+
+    def update_pipeline_status(self):
+        stats = self.pipeline.stats()
+        occupancy = " ".join(f"{stage} {stats['occupancy'][stage] * 100:.0f}%" for stage in STAGES)
+        text = (f"{stats['ppm']:.0f} parts/min | {stats['completed']} done, {stats['dropped']} dropped, "
+                f"{stats['overruns']} overruns | busy: {occupancy}")
+        if stats["errors"]:
+            text += f"\n{stats['errors']} errors, last: {stats['last_error'] or '-'}"
+        self.pipeline_label.config(text=text)
+        self.pipeline_status_job = self.root.after(1000, self.update_pipeline_status)
+
+    def set_leds(self, overall_result):
+        led_state = (overall_result == "OK", overall_result != "OK")
+        if led_state != self.led_state:
+            self.led_state = led_state
+            self.led_ok.itemconfig("led_ok", fill="#28a745" if led_state[0] else "#d4d4d4")
+            self.led_ng.itemconfig("led_ng", fill="#dc3545" if led_state[1] else "#d4d4d4")
+
+    @staticmethod
+    def spc_row(roi_id, inspection_type, s):
+        def fmt(value, spec=".2f"):
+            return "-" if value is None else format(value, spec)
+        return (roi_id, inspection_type, s["count"], fmt(s["mean"]), fmt(s["std"]), fmt(s["min"]), fmt(s["max"]),
+                fmt(s["yield"], ".1f") + "%" if s["yield"] is not None else "-", fmt(s["cp"]), fmt(s["cpk"]))
+
+    def update_spc_view(self):
+        self.spc_tree.delete(*self.spc_tree.get_children())
+        for roi_id, inspection_type, summary in self.spc.summaries():
+            row = self.spc_row(roi_id, inspection_type, summary)
+            cpk = summary["cpk"]
+            self.spc_tree.insert("", tk.END, values=row, tags=("low",) if cpk is not None and cpk < 1.33 else ())
+        self.spc_tree.tag_configure("low", foreground="red")
+
+    def reset_spc(self):
+        self.spc.reset()
+        self.update_spc_view()
+
+    def get_cycle_executor(self):
+        workers = max(1, self.cycle_workers.get())
+        mode = self.cycle_execution.get()
+        if self.cycle_executor is None or self.cycle_executor_workers != workers or self.cycle_executor_mode != mode:
+            if self.cycle_executor is not None:
+                self.cycle_executor.shutdown(wait=False)
+            if mode == "Processes":
+                self.cycle_executor = ProcessInspectionPool(workers)
+            else:
+                self.cycle_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inspection")
+            self.cycle_executor_workers = workers
+            self.cycle_executor_mode = mode
+        return self.cycle_executor
 
     def load_test_images(self):
         if self.mode.get() != "Mode Réglage":
@@ -1663,7 +2078,7 @@ class VisionHMI:
             self.show_toast("No test images loaded")
             return
         self.test_image_index.set((self.test_image_index.get() + 1) % len(self.test_images))
-        self.static_image = self.test_images[self.test_image_index.get()]
+        self.set_static_image(self.test_images[self.test_image_index.get()])
         self.use_static_image = True
         self.test_image_label.config(text=f"Test Image {self.test_image_index.get() + 1}/{len(self.test_images)}")
         self.show_toast(f"Displaying test image {self.test_image_index.get() + 1}")
@@ -1678,24 +2093,54 @@ class VisionHMI:
         original_use_static = self.use_static_image
         original_static_image = self.static_image
         self.use_static_image = True
-        for i, img in enumerate(self.test_images):
-            self.static_image = img
+
+        def run_image(i):
+            # Chained through on_done so the Tk loop keeps running between images
+            if i >= len(self.test_images) or self.cycle_state != "Idle":
+                self.use_static_image = original_use_static
+                self.set_static_image(original_static_image)
+                self.show_toast("Test cycle completed")
+                return
+            self.set_static_image(self.test_images[i])
             self.test_image_index.set(i)
             self.test_image_label.config(text=f"Test Image {i + 1}/{len(self.test_images)}")
-            self.run_cycle_logic()
-            self.root.update()
-            time.sleep(1)  # Simulate real-time processing
-        self.use_static_image = original_use_static
-        self.static_image = original_static_image
-        self.show_toast("Test cycle completed")
-
-    def get_image(self):
+            self.run_cycle_logic(on_done=lambda _: self.root.after(1000, lambda: run_image(i + 1)))  # Simulate real-time processing
+            if self.cycle_state == "Idle":  # cycle refused to start
+                run_image(len(self.test_images))
+        run_image(0)
+
+    def set_static_image(self, image):
+        with self.static_image_cond:
+            self.static_image = image
+            self.static_image_ts = time.monotonic()
+            self.static_image_cond.notify_all()
+
+    def next_static_frame(self, newer_than=None, timeout=1.0):
+        """(timestamp, copy) of the static image once one set after newer_than is there, None after timeout."""
+        with self.static_image_cond:
+            if not self.static_image_cond.wait_for(
+                    lambda: self.static_image is not None and (newer_than is None or self.static_image_ts > newer_than), timeout):
+                return None
+            return self.static_image_ts, self.static_image.copy()
+
+    def get_frame(self, newer_than=None):
+        """(capture timestamp, RGB frame copy); safe to call from the cycle worker thread.
+
+        newer_than (a trigger timestamp) makes the camera path wait for a frame exposed after it.
+        """
         if self.use_static_image:
-            return self.static_image.copy()
-        ret, frame = self.cap.read()
-        if not ret:
+            if self.static_image is None:
+                raise Exception("Camera still opening")
+            return time.monotonic(), self.static_image.copy()
+        latest = self.grabber.latest("inspected", timeout=1.0, newer_than=newer_than)
+        if latest is None:
             raise Exception("Failed to capture frame")
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame = latest[2]
+        return latest[1], cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+
+    def get_image(self, newer_than=None):
+        self.last_frame_ts, frame = self.get_frame(newer_than)
+        return frame
 
     def validate_selected_roi(self):
         if self.selected_roi is None:
@@ -1704,35 +2149,170 @@ class VisionHMI:
         return True
 
     def validate_parameters(self, param_keys):
-        for key in param_keys:
-            if key.endswith("_min") and f"{key[:-4]}_max" in self.params:
-                if not self.validate_min_max(key, f"{key[:-4]}_max"):
-                    return False
+        try:
+            invalid_ranges = self.get_settings().invalid_ranges
+        except (tk.TclError, ValueError) as e:
+            self.show_toast(f"Invalid parameter value: {e}")
+            return False
+        for min_key, max_key in invalid_ranges:
+            if min_key in param_keys:
+                self.show_toast(f"{min_key} must be <= {max_key}")
+                return False
         return True
 
-    def log_result(self, roi_id, inspection_type, result, details):
+    def log_result(self, roi_id, inspection_type, result, details, value=None, cycle_id=None):
+        # Queued for the logger thread; file and database I/O never run on the inspection path
+        if self.logger is None:  # init_log failed and said so; inspections still run
+            return
+        with self.metrics.time("log"):
+            self.logger.log((time.time(), cycle_id if cycle_id is not None else self.active_cycle_id,
+                             roi_id, inspection_type, result, value, details))
+
+    def set_perf_status(self, text):
+        # Remember what we put in the status bar so the periodic refresh never overwrites anyone else's message
+        self.perf_status = text
+        self.status_var.set(text)
+
+    def update_metrics(self):
         try:
-            with open(self.log_file, "a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), roi_id, inspection_type, result, details])
+            self.metrics.enabled = self.metrics_enabled.get()
+            if self.logger and self.logger.last_error is not self.log_error_shown:
+                self.log_error_shown = self.logger.last_error
+                self.show_toast(f"Log write error: {self.log_error_shown}")
+            if self.metrics.enabled:
+                fps = self.metrics.rate("display")
+                if self.perf_status is not None and self.status_var.get() == self.perf_status:
+                    cycle = self.metrics.last("cycle")
+                    self.set_perf_status(f"Cycle {cycle * 1000:.0f} ms | {fps:.1f} FPS" if cycle is not None else f"{fps:.1f} FPS")
+                gauges = {"display_fps": f"{fps:.2f}", "missed_triggers": self.missed_triggers}
+                if self.logger:
+                    gauges.update({f"log_{k}": v for k, v in self.logger.stats().items()})
+                gauges.update({f"archive_{k}": v for k, v in self.archiver.stats().items()})
+                if self.grabber:
+                    gauges.update({f"frames_{k}": v for k, v in self.grabber.stats().items()})
+                self.metrics.write_prometheus(self.metrics_file, gauges)
+                self.metrics_error = None
         except Exception as e:
-            self.show_toast(f"Logging error: {e}")
+            if str(e) != self.metrics_error:
+                self.metrics_error = str(e)
+                self.show_toast(f"Metrics export error: {e}")
+        finally:
+            self.root.after(self.metrics_interval_ms, self.update_metrics)
+
+    def get_history(self):
+        # Read-only connection for the Tk thread; WAL lets it read while the logger thread writes
+        if self.history is None:
+            self.history = InspectionHistory(self.history_file)
+        return self.history
 
     def view_log(self):
         try:
-            with open(self.log_file, "r") as f:
-                log_window = tk.Toplevel(self.root)
-                log_window.title("Inspection Log")
-                log_window.geometry("800x600")
-                text = tk.Text(log_window, font=("Segoe UI", 8), wrap=tk.NONE)
-                text.pack(fill=tk.BOTH, expand=True)
-                text.insert(tk.END, f.read())
-                text.config(state="disabled")
-                scrollbar_y = ttk.Scrollbar(log_window, orient=tk.VERTICAL, command=text.yview)
-                scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
-                scrollbar_x = ttk.Scrollbar(log_window, orient=tk.HORIZONTAL, command=text.xview)
-                scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
-                text.config(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+            history = self.get_history()
+            log_window = tk.Toplevel(self.root)
+            log_window.title("Inspection Log")
+            log_window.geometry("800x600")
+
+            filter_frame = ttk.Frame(log_window, padding=2)
+            filter_frame.pack(fill=tk.X)
+            roi_var, type_var, result_var = tk.StringVar(), tk.StringVar(), tk.StringVar()
+            start_var, end_var = tk.StringVar(), tk.StringVar()
+            ttk.Label(filter_frame, text="ROI").pack(side=tk.LEFT, padx=2)
+            ttk.Entry(filter_frame, textvariable=roi_var, width=4).pack(side=tk.LEFT, padx=2)
+            ttk.Label(filter_frame, text="Type").pack(side=tk.LEFT, padx=2)
+            ttk.Combobox(filter_frame, textvariable=type_var, values=[""] + history.inspection_types(), state="readonly", width=18).pack(side=tk.LEFT, padx=2)
+            ttk.Label(filter_frame, text="Result").pack(side=tk.LEFT, padx=2)
+            ttk.Combobox(filter_frame, textvariable=result_var, values=["", "OK", "NG"], state="readonly", width=4).pack(side=tk.LEFT, padx=2)
+            ttk.Label(filter_frame, text="From").pack(side=tk.LEFT, padx=2)
+            ttk.Entry(filter_frame, textvariable=start_var, width=16).pack(side=tk.LEFT, padx=2)
+            ttk.Label(filter_frame, text="To").pack(side=tk.LEFT, padx=2)
+            ttk.Entry(filter_frame, textvariable=end_var, width=16).pack(side=tk.LEFT, padx=2)
+
+            columns = ("Timestamp", "Cycle", "ROI", "Type", "Result", "Value", "Details")
+            tree = ttk.Treeview(log_window, columns=columns, show="headings")
+            for col, width in zip(columns, (120, 50, 40, 120, 50, 70, 300)):
+                tree.heading(col, text=col)
+                tree.column(col, width=width, stretch=col == "Details")
+            tree.tag_configure("NG", foreground="#dc3545")
+            scrollbar_y = ttk.Scrollbar(log_window, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar_y.set)
+
+            nav_frame = ttk.Frame(log_window, padding=2)
+            nav_frame.pack(side=tk.BOTTOM, fill=tk.X)
+            scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.pack(fill=tk.BOTH, expand=True)
+            page_label = ttk.Label(nav_frame, text="")
+            # page_starts[i] is the before_id used to load page i (None = newest)
+            state = {"filters": {}, "page_starts": [None], "last_id": None, "full": False}
+
+            def parse_time(text):
+                text = text.strip()
+                if not text:
+                    return None
+                for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+                    try:
+                        return datetime.strptime(text, fmt).timestamp()
+                    except ValueError:
+                        pass
+                raise ValueError(f"Invalid date '{text}' (use YYYY-MM-DD [HH:MM])")
+
+            def load_page():
+                rows = history.page(state["filters"], state["page_starts"][-1], self.log_page_size)
+                tree.delete(*tree.get_children())
+                for row in rows:
+                    _, ts, cycle_id, roi_id, insp_type, result, value, details = row
+                    tree.insert("", tk.END, values=(datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"),
+                                                    "" if cycle_id is None else cycle_id, roi_id, insp_type, result,
+                                                    "" if value is None else f"{value:.2f}", details), tags=(result,))
+                state["last_id"] = rows[-1][0] if rows else None
+                state["full"] = len(rows) == self.log_page_size
+                page_label.config(text=f"Page {len(state['page_starts'])}")
+
+            def apply_filters():
+                try:
+                    state["filters"] = {
+                        "roi_id": int(roi_var.get()) if roi_var.get().strip() else None,
+                        "inspection_type": type_var.get() or None,
+                        "result": result_var.get() or None,
+                        "start": parse_time(start_var.get()),
+                        "end": parse_time(end_var.get())
+                    }
+                except ValueError as e:
+                    self.show_toast(str(e))
+                    return
+                state["page_starts"] = [None]
+                load_page()
+
+            def next_page():
+                if state["full"]:
+                    state["page_starts"].append(state["last_id"])
+                    load_page()
+
+            def prev_page():
+                if len(state["page_starts"]) > 1:
+                    state["page_starts"].pop()
+                    load_page()
+
+            def export():
+                filename = filedialog.asksaveasfilename(parent=log_window, defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+                if filename:
+                    filters = dict(state["filters"])
+                    def worker():
+                        exporter = InspectionHistory(self.history_file)
+                        try:
+                            count = exporter.export_csv(filename, filters)
+                            self.root.after(0, lambda: self.show_toast(f"Exported {count} rows"))
+                        except Exception as e:
+                            self.root.after(0, lambda: self.show_toast(f"Export error: {e}"))
+                        finally:
+                            exporter.close()
+                    threading.Thread(target=worker, daemon=True).start()
+
+            ttk.Button(filter_frame, text="Filter", command=apply_filters).pack(side=tk.LEFT, padx=2)
+            ttk.Button(nav_frame, text="< Newer", command=prev_page).pack(side=tk.LEFT, padx=2)
+            page_label.pack(side=tk.LEFT, padx=5)
+            ttk.Button(nav_frame, text="Older >", command=next_page).pack(side=tk.LEFT, padx=2)
+            ttk.Button(nav_frame, text="Export CSV", command=export).pack(side=tk.RIGHT, padx=2)
+            load_page()
         except Exception as e:
             self.show_toast(f"Error viewing log: {e}")
 
@@ -1740,14 +2320,18 @@ class VisionHMI:
         try:
             img = self.get_image()
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"capture_{timestamp}.png"
-            cv2.imwrite(filename, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
-            self.show_toast(f"Image saved as {filename}")
+            filename = f"capture_{timestamp}"
+            if not self.archiver.save(img, filename):
+                raise Exception("Image writer busy")
+            self.show_toast(f"Image saved as {filename}.{'jpg' if self.archiver.image_format == 'jpeg' else 'png'}")
         except Exception as e:
             self.show_toast(f"Save image error: {e}")
 
     def generate_pdf_report(self):
         try:
+            # reportlab is only needed here; importing it at startup slows every launch
+            from reportlab.lib.pagesizes import letter
+            from reportlab.pdfgen import canvas
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"report_{timestamp}.pdf"
             c = canvas.Canvas(filename, pagesize=letter)
@@ -1762,6 +2346,21 @@ class VisionHMI:
                     c.drawString(70, y, f"{insp_type}: {res['result']} - {res['details']}")
                     y -= 20
                 y -= 10
+            summaries = self.spc.summaries()
+            if summaries:
+                c.drawString(50, y, f"Process statistics (last {self.spc.window} cycles per ROI and inspection)")
+                y -= 20
+                c.setFont("Helvetica", 8)
+                header = ("ROI", "Inspection", "N", "Mean", "Std", "Min", "Max", "Yield", "Cp", "Cpk")
+                columns = (50, 80, 190, 220, 275, 330, 385, 440, 485, 525)
+                for row in [header] + [self.spc_row(*summary) for summary in summaries]:
+                    if y < 50:
+                        c.showPage()
+                        c.setFont("Helvetica", 8)
+                        y = 750
+                    for x, value in zip(columns, row):
+                        c.drawString(x, y, str(value))
+                    y -= 14
             c.save()
             self.show_toast(f"PDF report saved as {filename}")
         except Exception as e:
@@ -1770,6 +2369,14 @@ class VisionHMI:
     def save_settings(self):
         try:
             settings = {k: v.get() for k, v in self.params.items()}
+            settings["display_fps"] = self.display_fps.get()
+            settings["cycle_workers"] = self.cycle_workers.get()
+            settings["cycle_execution"] = self.cycle_execution.get()
+            settings["metrics_enabled"] = self.metrics_enabled.get()
+            settings["trigger_debounce_ms"] = self.trigger_debounce_ms.get()
+            settings["archive"] = {"enabled": self.archive_enabled.get(), "format": self.archive_format.get(),
+                                   "png_level": self.archive_png_level.get(), "jpeg_quality": self.archive_jpeg_quality.get(),
+                                   "ok_every": self.archive_ok_every.get(), "quota_mb": self.archive_quota_mb.get()}
             with open("settings.json", "w") as f:
                 json.dump(settings, f, indent=4)
             self.show_toast("Settings saved")
@@ -1784,8 +2391,20 @@ class VisionHMI:
                 for k, v in settings.items():
                     if k in self.params:
                         self.params[k].set(v)
-                self.gpio_label.config(text=f"Pin: GPIO{self.params['gpio_trigger_pin'].get()}" if self.params['gpio_trigger_pin'].get() != -1 else "Pin: None")
-                self.start_gpio_simulation()
+                self.display_fps.set(settings.get("display_fps", self.display_fps.get()))
+                self.cycle_workers.set(settings.get("cycle_workers", self.cycle_workers.get()))
+                self.cycle_execution.set(settings.get("cycle_execution", self.cycle_execution.get()))
+                self.metrics_enabled.set(settings.get("metrics_enabled", self.metrics_enabled.get()))
+                self.trigger_debounce_ms.set(settings.get("trigger_debounce_ms", self.trigger_debounce_ms.get()))
+                archive = settings.get("archive", {})
+                self.archive_enabled.set(archive.get("enabled", self.archive_enabled.get()))
+                self.archive_format.set(archive.get("format", self.archive_format.get()))
+                self.archive_png_level.set(archive.get("png_level", self.archive_png_level.get()))
+                self.archive_jpeg_quality.set(archive.get("jpeg_quality", self.archive_jpeg_quality.get()))
+                self.archive_ok_every.set(archive.get("ok_every", self.archive_ok_every.get()))
+                self.archive_quota_mb.set(archive.get("quota_mb", self.archive_quota_mb.get()))
+                self.update_gpio_label()
+                self.start_trigger()
                 self.show_toast("Settings loaded")
         except Exception as e:
             self.show_toast(f"Load settings error: {e}")
@@ -1795,9 +2414,10 @@ class VisionHMI:
             config = {
                 "params": {k: v.get() for k, v in self.params.items()},
                 "cycle_features": {k: v.get() for k, v in self.cycle_features.items()},
-                "rois": [(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7].tolist()) for r in self.rois],
+                "rois": [roi_to_json(r) for r in self.rois],
                 "blob_outputs": {k: v.get() for k, v in self.blob_outputs.items()},
-                "judgment_criteria": {k: v.get() for k, v in self.judgment_criteria.items()}
+                "judgment_criteria": {k: v.get() for k, v in self.judgment_criteria.items()},
+                "template": encode_image(self.template_image) if self.template_image is not None else None
             }
             filename = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
             if filename:
@@ -1825,10 +2445,12 @@ class VisionHMI:
                 for k, v in config.get("judgment_criteria", {}).items():
                     if k in self.judgment_criteria:
                         self.judgment_criteria[k].set(v)
-                self.rois = [(r[0], r[1], r[2], r[3], r[4], r[5], r[6], np.array(r[7], dtype=np.uint8)) for r in config["rois"]]
+                self.rois = [roi_from_json(r) for r in config["rois"]]
+                self.roi_version += 1
                 self.roi_id = max([r[4] for r in self.rois] + [-1]) + 1
-                self.gpio_label.config(text=f"Pin: GPIO{self.params['gpio_trigger_pin'].get()}" if self.params['gpio_trigger_pin'].get() != -1 else "Pin: None")
-                self.start_gpio_simulation()
+                self.set_template(decode_image(config["template"]) if config.get("template") else None)
+                self.update_gpio_label()
+                self.start_trigger()
                 self.show_toast("Cycle configuration loaded")
         except Exception as e:
             self.show_toast(f"Load config error: {e}")
@@ -1856,11 +2478,21 @@ class VisionHMI:
 
     def on_closing(self):
         try:
+            if self.grabber:
+                self.grabber.stop()
+            if self.pipeline:
+                self.pipeline.stop()
+            if self.cycle_executor:
+                self.cycle_executor.shutdown(wait=False)
+            if self.logger:
+                self.logger.close()
+            self.archiver.close()
+            if self.history:
+                self.history.close()
             if self.cap:
                 self.cap.release()
             cv2.destroyAllWindows()
-            if self.gpio_thread and self.gpio_thread.is_alive():
-                self.params["gpio_trigger_pin"].set(-1)
+            self.stop_trigger()
             self.save_settings()
             self.root.destroy()
         except Exception as e:
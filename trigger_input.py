@@ -0,0 +1,129 @@
+"""Edge-triggered cycle start: Raspberry Pi GPIO or a local FIFO for off-Pi testing."""
+import errno
+import os
+from abc import ABC, abstractmethod
+import select
+import statistics
+import threading
+import time
+from collections import deque
+
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):  # not on a Pi, or no access to /dev/gpiomem
+    GPIO = None
+
+class TriggerSource(ABC):
+    """Calls callback(timestamp) once per accepted edge, timestamp from time.monotonic().
+
+    Edges closer than debounce_ms to the previously accepted one are ignored.
+    Callbacks run on the source's own thread.
+    """
+
+    def __init__(self, callback, debounce_ms=20):
+        self.callback = callback
+        self.debounce = debounce_ms / 1000.0
+        self.counters = {"accepted": 0, "bounced": 0}
+        self._last_edge = float("-inf")
+
+    def _edge(self):
+        now = time.monotonic()
+        if now - self._last_edge < self.debounce:
+            self.counters["bounced"] += 1
+            return
+        self._last_edge = now
+        self.counters["accepted"] += 1
+        self.callback(now)
+
+    @abstractmethod
+    def start(self):
+        """Begin delivering edges."""
+
+    @abstractmethod
+    def stop(self):
+        """Stop delivering edges and release the input."""
+
+class GpioTrigger(TriggerSource):
+    """Rising edge on a BCM pin, delivered by the RPi.GPIO edge-detection thread."""
+
+    def __init__(self, pin, callback, debounce_ms=20):
+        if GPIO is None:
+            raise RuntimeError("RPi.GPIO is not available")
+        super().__init__(callback, debounce_ms)
+        self.pin = pin
+
+    def start(self):
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+        GPIO.add_event_detect(self.pin, GPIO.RISING, callback=lambda channel: self._edge())
+
+    def stop(self):
+        GPIO.remove_event_detect(self.pin)
+        GPIO.cleanup(self.pin)
+
+class FifoTrigger(TriggerSource):
+    """Software trigger: every line written to a named pipe counts as one edge.
+
+    e.g. echo > /tmp/visionmaster_trigger
+    """
+
+    def __init__(self, path, callback, debounce_ms=20):
+        super().__init__(callback, debounce_ms)
+        self.path = path
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        try:
+            os.mkfifo(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="FifoTrigger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def _run(self):
+        # O_RDWR keeps a writer attached so select() does not spin on EOF between writers
+        fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            while self._running:
+                ready, _, _ = select.select([fd], [], [], 0.2)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 4096)
+                except BlockingIOError:
+                    continue
+                for _ in range(max(1, data.count(b"\n"))):
+                    self._edge()
+        finally:
+            os.close(fd)
+
+class LatencyLog:
+    """Rolling record of per-cycle trigger -> capture -> verdict latencies, in milliseconds."""
+
+    def __init__(self, size=1000):
+        self.records = deque(maxlen=size)
+
+    def add(self, trigger_ts, capture_ts, verdict_ts):
+        record = ((capture_ts - trigger_ts) * 1000, (verdict_ts - capture_ts) * 1000, (verdict_ts - trigger_ts) * 1000)
+        self.records.append(record)
+        return record
+
+    def summary(self):
+        if not self.records:
+            return None
+        totals = sorted(r[2] for r in self.records)
+        return {
+            "count": len(totals),
+            "mean_ms": statistics.fmean(totals),
+            "p95_ms": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            "max_ms": totals[-1]
+        }